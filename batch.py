@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, NamedTuple, Optional
+
+import instrumentation
+from batch_journal import BatchJournal
+from instrumentation import Recorder
+from settings import SoundifierSettings
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+
+class BatchJob(NamedTuple):
+    gif_path: str
+    voice_paths: tuple[str, ...]
+    settings: SoundifierSettings
+
+
+class BatchResult(NamedTuple):
+    job: BatchJob
+    succeeded: bool
+    error: Optional[str]
+    seconds: float
+    # Whether the render cache already had this exact render
+    from_cache: bool = False
+    # Whether an earlier run of the same batch already saved it, so it was skipped
+    resumed: bool = False
+    # What instrumentation recorded while rendering it, when the batch was recorded
+    events: Optional[list[dict]] = None
+
+
+def make_output_base_name(output_folder: str, gif_path: str) -> str:
+    return output_folder + "/" + gif_path.replace("\\", "/").split("/")[-1][:-4]
+
+
+def make_batch_jobs(gif_paths: list[str], voice_paths: list[str], settings: SoundifierSettings,
+                    output_folder: str, do_gifs: bool) -> list[BatchJob]:
+    jobs = []
+    for gif_path in gif_paths:
+        output_base_name = make_output_base_name(output_folder, gif_path)
+        jobs.append(BatchJob(gif_path, tuple(voice_paths), settings.snapshot(
+            output_audio_path=output_base_name + ".wav",
+            output_gif_path=output_base_name + ".gif" if do_gifs else None
+        )))
+    return jobs
+
+
+def check_output_paths(jobs: list[BatchJob]) -> None:
+    # Gifs with the same name from different folders would all be saved over each other, and the journal would only
+    # remember the last one, so that's refused before anything is rendered
+    owners: dict[str, str] = {}
+    for job in jobs:
+        for output_path in (job.settings.output_audio_path, job.settings.output_gif_path):
+            if output_path is None:
+                continue
+            output_key = os.path.normcase(os.path.abspath(output_path))
+            owner = owners.setdefault(output_key, job.gif_path)
+            if owner != job.gif_path:
+                raise ValueError(f"{owner} and {job.gif_path} would both be saved to {output_path}")
+
+
+def render_job(job: BatchJob, instrumented: bool = False) -> BatchResult:
+    # Imported here so the window can list batch settings without waiting on the audio stack
+    import processor
+
+    # Jobs can run in another process, so they record on their own and the events are sent back with the result
+    recorder = Recorder() if instrumented else None
+    start = time.perf_counter()
+    try:
+        from_cache = processor.make_and_save_blip_track(job.gif_path, job.settings, *job.voice_paths, recorder=recorder)
+        return BatchResult(job, True, None, time.perf_counter() - start, from_cache,
+                           events=recorder.events if recorder is not None else None)
+    except Exception as e:
+        return BatchResult(job, False, f"{type(e).__name__}: {e}", time.perf_counter() - start,
+                           events=recorder.events if recorder is not None else None)
+
+
+def start_worker(json_logging: Optional[bool], voices: list) -> None:
+    # Spawned workers start with nothing set up, so they'd drop everything they log without this
+    if json_logging is not None:
+        instrumentation.configure_logging(json_logging)
+
+    import voice_cache
+    voice_cache.preload_voices(voices)
+
+
+def render_batch(jobs: list[BatchJob], workers: int = DEFAULT_WORKERS,
+                 on_result: Optional[Callable[[BatchResult, int, int], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 journal: Optional[BatchJournal] = None,
+                 recorder: Optional[Recorder] = None) -> list[BatchResult]:
+    results = []
+    if len(jobs) == 0:
+        return results
+
+    def finish(result: BatchResult) -> None:
+        if journal is not None and not result.resumed:
+            journal.record(result)
+        if recorder is not None and result.events is not None:
+            recorder.merge(result.events)
+        results.append(result)
+        if on_result is not None:
+            on_result(result, len(results), len(jobs))
+
+    pending_jobs = []
+    for job in jobs:
+        if journal is not None and journal.is_done(job):
+            finish(BatchResult(job, True, None, 0.0, resumed=True))
+        else:
+            pending_jobs.append(job)
+
+    if len(pending_jobs) == 0:
+        return results
+
+    if workers <= 1 or len(pending_jobs) == 1:
+        for job in pending_jobs:
+            if should_stop is not None and should_stop():
+                break
+            finish(render_job(job, recorder is not None))
+        return results
+
+    import processor
+    import voice_cache
+
+    # Decode every voice once here and hand the samples to the workers, instead of each worker decoding them again.
+    # Numbered voice patterns like tenna#.wav are expanded first, since they aren't files themselves.
+    voice_paths = sorted({voice_path for job in pending_jobs for voice_path in processor.expand_voice_paths(job.voice_paths)})
+    voices = voice_cache.export_voices(voice_paths)
+
+    # Workers are always spawned, never forked. The GUI has preview and prefetch threads running, and a fork taken
+    # while one of them holds a lock (the voice cache's, a logging handler's) would leave the worker stuck on it.
+    # Windows and frozen builds can only spawn anyway.
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending_jobs)), mp_context=multiprocessing.get_context("spawn"),
+                             initializer=start_worker, initargs=(instrumentation.JSON_LOGGING, voices)) as executor:
+        futures = [executor.submit(render_job, job, recorder is not None) for job in pending_jobs]
+        for future in as_completed(futures):
+            finish(future.result())
+            if should_stop is not None and should_stop():
+                for pending in futures:
+                    pending.cancel()
+                break
+
+    return results
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional, TYPE_CHECKING
+
+import render_cache
+from instrumentation import log_event
+
+if TYPE_CHECKING:
+    from batch import BatchJob, BatchResult
+
+JOURNAL_NAME = ".soundifier_journal.jsonl"
+
+DONE = "done"
+FAILED = "failed"
+
+
+def get_journal_path(output_folder: str) -> str:
+    return output_folder + "/" + JOURNAL_NAME
+
+
+class BatchJournal:
+    # Remembers how every job of a batch went, one JSON line per finished job, so a batch that was stopped or had
+    # failures can be run again and only redo what didn't get done. The latest line for an output wins.
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        self.digests: dict[str, Optional[str]] = {}
+        self.lock = threading.Lock()
+
+        if resume:
+            self.load()
+        self.rewrite()
+
+    def load(self) -> None:
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry["output_audio_path"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    # Most likely the last line, cut off by the batch being killed halfway through writing it
+                    continue
+
+    def rewrite(self) -> None:
+        # Drops lines that later ones replaced, so the journal doesn't keep growing with every run
+        temporary_path = self.path + ".tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                for entry in self.entries.values():
+                    file.write(json.dumps(entry) + "\n")
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            log_event("journal_failed", f"Couldn't write to the batch journal {self.path}.\n\tCaused by: {e}",
+                      logging.WARNING, path=self.path, error=str(e))
+
+    def get_job_digest(self, job: "BatchJob") -> Optional[str]:
+        # Worked out before the job is rendered, so it describes the inputs the output was actually made from
+        output_path = job.settings.output_audio_path
+        if output_path not in self.digests:
+            import processor
+            try:
+                voice_paths = processor.expand_voice_paths(job.voice_paths)
+                self.digests[output_path] = render_cache.get_inputs_digest(job.gif_path, voice_paths, job.settings)
+            except OSError:
+                self.digests[output_path] = None
+        return self.digests[output_path]
+
+    def get_seed(self) -> Optional[int]:
+        # The seed is part of every job's digest, so a batch picked back up in a new session has to use the seed it
+        # was started with for its finished jobs to count as done
+        seeds = {entry.get("seed") for entry in self.entries.values()}
+        return seeds.pop() if len(seeds) == 1 else None
+
+    def is_done(self, job: "BatchJob") -> bool:
+        digest = self.get_job_digest(job)
+        entry = self.entries.get(job.settings.output_audio_path)
+        if entry is None or entry["status"] != DONE or digest is None or entry["digest"] != digest:
+            return False
+
+        output_paths = [job.settings.output_audio_path, job.settings.output_gif_path]
+        return all(os.path.isfile(path) for path in output_paths if path is not None)
+
+    def record(self, result: "BatchResult") -> None:
+        job = result.job
+        entry = {
+            "output_audio_path": job.settings.output_audio_path,
+            "output_gif_path": job.settings.output_gif_path,
+            "gif": job.gif_path,
+            "voices": list(job.voice_paths),
+            "digest": self.get_job_digest(job),
+            "seed": job.settings.seed,
+            "status": DONE if result.succeeded else FAILED,
+            "error": result.error,
+            "seconds": round(result.seconds, 4),
+            "finished_at": time.time()
+        }
+
+        with self.lock:
+            self.entries[entry["output_audio_path"]] = entry
+            try:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                log_event("journal_failed", f"Couldn't write to the batch journal {self.path}.\n\tCaused by: {e}",
+                          logging.WARNING, path=self.path, error=str(e))
@@ -0,0 +1,264 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from PIL import Image, ImageDraw
+
+import processor
+from girlhelp import CACHE_DIRECTORY_VARIABLE, cache_path, resource_path
+from settings import SoundifierSettings
+
+# Wall-clock times only mean something next to a run on the same machine, so the baseline is kept per user
+BASELINE_PATH = cache_path("benchmark_baseline.json")
+# Smaller differences than this are within what the same case varies by from one run to the next
+MIN_REGRESSION_SECONDS = 0.05
+
+VOICE_SETS = {
+    "typer": ["test voices/typer.wav"],
+    "sans": ["test voices/sans.wav"],
+    "tenna": ["test voices/deltarune/tenna#.wav"]
+}
+
+
+class BenchmarkCase(NamedTuple):
+    name: str
+    letters: int
+    width: int
+    height: int
+    fps: int
+    voices: str
+    pitch: bool = False
+    overlap_prevention: bool = False
+
+
+DEFAULT_CASES = [
+    BenchmarkCase("short", 60, 582, 156, 30, "typer"),
+    BenchmarkCase("long", 600, 582, 156, 30, "sans", overlap_prevention=True),
+    BenchmarkCase("long_60fps", 600, 582, 156, 60, "typer"),
+    BenchmarkCase("hires", 200, 1164, 312, 30, "typer"),
+    BenchmarkCase("pitched", 300, 582, 156, 30, "tenna", pitch=True),
+    BenchmarkCase("huge", 3000, 582, 156, 60, "tenna", pitch=True, overlap_prevention=True)
+]
+
+QUICK_CASES = DEFAULT_CASES[:3]
+
+
+def make_synthetic_gif(path: str, case: BenchmarkCase) -> None:
+    canvas = Image.new("P", (case.width, case.height), 0)
+    canvas.putpalette([0, 0, 0, 255, 255, 255] + [0, 0, 0] * 254)
+    frames = make_synthetic_frames(canvas, case)
+    # Frames are generated while saving so that making a huge gif doesn't skew the peak memory numbers
+    next(frames).save(path, save_all=True, append_images=frames, duration=round(1000 / case.fps), loop=0, disposal=2)
+
+
+def make_synthetic_frames(canvas: Image.Image, case: BenchmarkCase) -> Iterator[Image.Image]:
+    # Letters appear one per frame, with a pause every 40 of them like the end of a sentence
+    letter_width = max(4, case.width // 40)
+    letter_height = max(6, case.height // 6)
+    letters_per_line = max(1, (case.width - letter_width) // (letter_width + 2))
+    lines = max(1, case.height // (letter_height + 4))
+    draw = ImageDraw.Draw(canvas)
+
+    yield canvas.copy()
+    for letter in range(case.letters):
+        line = (letter // letters_per_line) % lines
+        column = letter % letters_per_line
+        if column == 0 and line == 0 and letter > 0:
+            draw.rectangle((0, 0, case.width, case.height), fill=0)
+
+        x = letter_width // 2 + column * (letter_width + 2)
+        y = 4 + line * (letter_height + 4)
+        draw.rectangle((x, y, x + letter_width - 1, y + letter_height - 1), fill=1)
+        yield canvas.copy()
+
+        if letter % 40 == 39:
+            for _ in range(max(3, case.fps // 3)):
+                yield canvas.copy()
+
+    for _ in range(case.fps):
+        yield canvas.copy()
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def time_stage(stage: Callable[[], object]) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = stage()
+    return time.perf_counter() - start, result
+
+
+def get_case_inputs(case: BenchmarkCase, work_folder: str) -> tuple[str, list[str], SoundifierSettings]:
+    voices = [resource_path(voice) for voice in VOICE_SETS[case.voices]]
+    settings = SoundifierSettings(f"{work_folder}/{case.name}.wav")
+    settings.making_for_preview = False
+    settings.skip_punctuation = False
+    settings.seed = 0
+    settings.do_overlap_prevention = case.overlap_prevention
+    if case.pitch:
+        settings.min_pitch = 0.8
+        settings.max_pitch = 1.25
+    return f"{work_folder}/{case.name}.gif", voices, settings
+
+
+def run_timings(case: BenchmarkCase, work_folder: str) -> dict:
+    # Decoding the gif is left on disk in the run's frame cache, so the mixing steps after this don't repeat it
+    gif_path, _, settings = get_case_inputs(case, work_folder)
+    make_synthetic_gif(gif_path, case)
+    seconds, timings = time_stage(lambda: processor.get_blip_timings_from_gif(gif_path, settings))
+    return {"blips": len(timings), "stages": {"timings": seconds}}
+
+
+def run_mix(case: BenchmarkCase, work_folder: str) -> dict:
+    gif_path, voices, settings = get_case_inputs(case, work_folder)
+    stages = {}
+    stages["mix"], mix = time_stage(lambda: processor.make_blip_mix(gif_path, settings, *voices))
+    stages["export"], _ = time_stage(lambda: processor.save_blip_track(settings, mix))
+    return {"stages": stages, "peak_rss_mb": get_peak_rss_mb()}
+
+
+def run_streamed_mix(case: BenchmarkCase, work_folder: str) -> dict:
+    gif_path, voices, settings = get_case_inputs(case, work_folder)
+    streaming_settings = settings.snapshot(stream_audio=True, output_audio_path=f"{work_folder}/{case.name}_streamed.wav")
+    seconds, _ = time_stage(lambda: processor.make_and_save_blip_track(gif_path, streaming_settings, *voices))
+    return {"stages": {"mix_and_stream": seconds}, "streamed_peak_rss_mb": get_peak_rss_mb()}
+
+
+CASE_STEPS = (run_timings, run_mix, run_streamed_mix)
+
+
+def run_step(step: Callable[[BenchmarkCase, str], dict], case: BenchmarkCase, work_folder: str) -> dict:
+    # The peak memory of a process only ever goes up, so every step gets a fresh one and its peak is its own. That's
+    # also what keeps a mix in memory and a streamed one from hiding each other's peak. The disk caches live in the
+    # run's folder, so nothing is served from a render an earlier run left behind and the user's own caches stay
+    # untouched.
+    os.environ[CACHE_DIRECTORY_VARIABLE] = f"{work_folder}/cache"
+    return step(case, work_folder)
+
+
+def run_case(case: BenchmarkCase, work_folder: str, context: multiprocessing.context.BaseContext) -> dict:
+    result = {"case": case._asdict(), "stages": {}}
+    for step in CASE_STEPS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            step_result = executor.submit(run_step, step, case, work_folder).result()
+        result["stages"].update({name: round(seconds, 5) for name, seconds in step_result.pop("stages").items()})
+        result.update(step_result)
+    return result
+
+
+def compare_to_baseline(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    baseline_cases = {result["case"]["name"]: result for result in baseline.get("results", [])}
+    for result in results:
+        previous = baseline_cases.get(result["case"]["name"])
+        if previous is None or previous["case"] != result["case"]:
+            continue
+
+        for stage, seconds in result["stages"].items():
+            before = previous["stages"].get(stage)
+            if before is None or before <= 0:
+                continue
+            ratio = seconds / before
+            result.setdefault("vs_baseline", {})[stage] = round(ratio, 3)
+            if ratio > tolerance and seconds - before > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{result['case']['name']}/{stage}: {before:.4f}s -> {seconds:.4f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def print_results(results: list[dict]) -> None:
+    stage_names = list(results[0]["stages"].keys())
+    print(f"{'case':<12}{'blips':>7}" + "".join(f"{name:>16}" for name in stage_names)
+          + f"{'blips/s':>10}{'peak MB':>9}{'streamed':>10}")
+    for result in results:
+        line = f"{result['case']['name']:<12}{result['blips']:>7}"
+        for name in stage_names:
+            seconds = f"{result['stages'][name] * 1000:.1f}ms"
+            ratio = result.get("vs_baseline", {}).get(name)
+            line += f"{seconds + (f' {ratio:.2f}x' if ratio is not None else ''):>16}"
+        line += f"{result['blips_per_second'] or '-':>10}{result['peak_rss_mb'] or '-':>9}"
+        line += f"{result['streamed_peak_rss_mb'] or '-':>10}"
+        print(line)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark gif timing extraction, mixing and export.")
+    parser.add_argument("--quick", action="store_true", help="Only run the small cases")
+    parser.add_argument("--case", action="append", default=[], help="Only run the named case (can be repeated)")
+    parser.add_argument("--repeat", type=int, default=3, help="Run every case this many times and keep the fastest")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline from an earlier run on this machine")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with an error when a stage is slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Slowdown ratio that counts as a regression")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    cases = QUICK_CASES if args.quick else DEFAULT_CASES
+    if len(args.case) > 0:
+        cases = [case for case in DEFAULT_CASES if case.name in args.case]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as work_folder:
+        for case in cases:
+            runs = []
+            for run in range(max(1, args.repeat)):
+                run_folder = f"{work_folder}/{case.name}_{run}"
+                os.makedirs(run_folder)
+                runs.append(run_case(case, run_folder, context))
+
+            best = runs[0]
+            for stage in best["stages"]:
+                best["stages"][stage] = min(run["stages"][stage] for run in runs)
+            best["blips_per_second"] = round(best["blips"] / best["stages"]["mix"]) if best["stages"]["mix"] > 0 else None
+            for peak in ("peak_rss_mb", "streamed_peak_rss_mb"):
+                peaks = [run[peak] for run in runs if run[peak] is not None]
+                best[peak] = max(peaks) if len(peaks) > 0 else None
+            results.append(best)
+
+    regressions = []
+    if args.save_baseline:
+        pass
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare_to_baseline(results, json.load(file), args.tolerance)
+    else:
+        print(f"No baseline at {args.baseline}, so there's nothing to compare against. Run with --save-baseline to make one.")
+
+    print_results(results)
+
+    report = {"python": sys.version.split()[0], "platform": sys.platform, "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    if len(regressions) > 0:
+        print("\nSlower than the baseline:")
+        for regression in regressions:
+            print(f"\t{regression}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
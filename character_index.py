@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import NamedTuple, Optional
+
+from girlhelp import cache_path
+from instrumentation import log_event
+
+INDEX_VERSION = 3
+
+# Written into the voices folder when the app is built, see write_manifest
+MANIFEST_FILE = "character_manifest.json"
+
+MULTI_MARKER = ".multi"
+VARIANT_MARKER = ".variant"
+
+SINGLE_VOICE = "voice"
+VOICE_FOLDER = "folder"
+VARIANT_FOLDER = "variant"
+
+
+class CharacterEntry(NamedTuple):
+    # Just enough to list a character. Its voices and settings are only read once it's picked.
+    name: str
+    universe: str
+    kind: str
+    # A .wav file for single voice characters, a folder for everything else
+    path: str
+
+
+def get_index_file() -> str:
+    return cache_path("character_index.json")
+
+
+def get_directory_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_characters(root: str) -> tuple[list[CharacterEntry], dict[str, int]]:
+    # Only folders are listed here, nothing is opened. Any voice or marker file being added or removed changes the
+    # mtime of the folder it's in, so the mtimes of everything listed are enough to tell when the index is stale.
+    entries = []
+    directories = {}
+
+    def scan(relative_path: str, prefix: str, universe: str) -> None:
+        path = root + relative_path
+        directories[relative_path] = get_directory_mtime(path)
+        for character in os.listdir(path):
+            full_path = path + character
+            if os.path.isfile(full_path):
+                if character.endswith(".wav"):
+                    entries.append(CharacterEntry(prefix + character[:-4], universe, SINGLE_VOICE, relative_path + character))
+            elif os.path.isdir(full_path):
+                if os.path.isfile(full_path + "/" + MULTI_MARKER):
+                    scan(relative_path + character + "/", prefix + character + "/", character)
+                else:
+                    directories[relative_path + character + "/"] = get_directory_mtime(full_path)
+                    kind = VARIANT_FOLDER if os.path.isfile(full_path + "/" + VARIANT_MARKER) else VOICE_FOLDER
+                    entries.append(CharacterEntry(prefix + character, universe, kind, relative_path + character))
+
+    scan("", "", "Basic")
+    return entries, directories
+
+
+def is_bundled(root: str) -> bool:
+    # A --onefile build unpacks its files to a new temporary folder, with new mtimes, every time it starts. What's in
+    # there can't change without a new version of the app though.
+    bundle_path = getattr(sys, "_MEIPASS", None)
+    if bundle_path is None:
+        return False
+    return os.path.abspath(root).startswith(os.path.abspath(bundle_path) + os.sep)
+
+
+def get_voices_digest(root: str) -> str:
+    # Every file in the voices folder, by name and content
+    digest = hashlib.sha256()
+    for directory, directory_names, file_names in os.walk(root):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            path = os.path.join(directory, file_name)
+            relative_path = os.path.relpath(path, root).replace("\\", "/")
+            if relative_path == MANIFEST_FILE:
+                continue
+            digest.update(relative_path.encode("utf-8") + b"\0")
+            with open(path, "rb") as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+def write_manifest(root: str) -> None:
+    with open(root + MANIFEST_FILE, "w", encoding="utf-8") as file:
+        json.dump({"digest": get_voices_digest(root)}, file)
+
+
+def read_manifest_digest(root: str) -> Optional[str]:
+    try:
+        with open(root + MANIFEST_FILE, "r", encoding="utf-8") as file:
+            return json.load(file)["digest"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def get_index_source(root: str, app_version: str) -> Optional[dict]:
+    # What the index was made from. Bundled voices are told apart by the app version and the manifest the build wrote,
+    # so a rebuild with different voices is noticed even if the version stayed the same. A build without a manifest
+    # has nothing to go on, so its index is never kept. Everything else is told apart by where it is.
+    if is_bundled(root):
+        manifest_digest = read_manifest_digest(root)
+        if manifest_digest is None:
+            return None
+        return {"bundled": app_version, "manifest": manifest_digest}
+    return {"root": os.path.abspath(root)}
+
+
+def load_index(root: str, app_version: str) -> Optional[list[CharacterEntry]]:
+    index_file = get_index_file()
+    if not os.path.isfile(index_file):
+        return None
+
+    try:
+        with open(index_file, "r", encoding="utf-8") as file:
+            index = json.load(file)
+        source = get_index_source(root, app_version)
+        if source is None or index["version"] != INDEX_VERSION or index["source"] != source:
+            return None
+        if not is_bundled(root):
+            for relative_path, mtime in index["directories"].items():
+                if get_directory_mtime(root + relative_path) != mtime:
+                    return None
+        return [CharacterEntry(*entry) for entry in index["characters"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def store_index(root: str, app_version: str, entries: list[CharacterEntry], directories: dict[str, int]) -> None:
+    source = get_index_source(root, app_version)
+    if source is None:
+        return
+    index = {
+        "version": INDEX_VERSION,
+        "source": source,
+        "directories": directories,
+        "characters": [list(entry) for entry in entries],
+    }
+
+    index_file = get_index_file()
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        temporary_file = index_file + ".tmp"
+        with open(temporary_file, "w", encoding="utf-8") as file:
+            json.dump(index, file, separators=(",", ":"))
+        os.replace(temporary_file, index_file)
+    except OSError as e:
+        log_event("character_index_failed", f"Couldn't save the character index.\n\tCaused by: {e}", logging.WARNING,
+                  path=index_file, error=str(e))
+
+
+def get_character_entries(root: str, app_version: str) -> list[CharacterEntry]:
+    # root is the voices folder, ending in a slash
+    entries = load_index(root, app_version)
+    if entries is None:
+        entries, directories = scan_characters(root)
+        store_index(root, app_version, entries, directories)
+    return entries
+
+
+if __name__ == '__main__':
+    # Run by the build before packaging, with the voices folder to write the manifest into
+    write_manifest(sys.argv[1].replace("\\", "/").rstrip("/") + "/")
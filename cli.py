@@ -0,0 +1,258 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Optional
+
+import batch
+from batch_journal import BatchJournal, get_journal_path
+from instrumentation import Recorder, configure_logging, log_event, summarize_events
+from settings import SoundifierSettings
+
+# This module is what the render farm runs, so it must never import PyQt6 (or gui, which does).
+
+# Settings that hold fractions, even though they default to a whole number
+FLOAT_SETTINGS = ("speed", "min_pitch", "max_pitch", "random_pitch_chance")
+# Settings that default to None but hold whole numbers when they're set
+INTEGER_SETTINGS = ("seed", "output_frame_rate", "output_channels", "output_sample_width")
+
+
+def parse_integer(name: str, text: str) -> int:
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"Setting {name} should be a whole number, not {text}") from None
+
+
+def parse_setting_value(name: str, text: str) -> Any:
+    default = getattr(SoundifierSettings(""), name, None)
+    if isinstance(default, bool):
+        if text.lower() in ("1", "true", "yes", "on"):
+            return True
+        if text.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"Setting {name} should be true or false, not {text}")
+    if name in FLOAT_SETTINGS or isinstance(default, float):
+        try:
+            return float(text)
+        except ValueError:
+            raise ValueError(f"Setting {name} should be a number, not {text}") from None
+    if isinstance(default, int):
+        return parse_integer(name, text)
+    if text.lower() == "none":
+        return None
+    if name in INTEGER_SETTINGS:
+        return parse_integer(name, text)
+    return text
+
+
+def parse_setting_overrides(assignments: list[str]) -> dict[str, Any]:
+    overrides = {}
+    for assignment in assignments:
+        if "=" not in assignment:
+            raise ValueError(f"Settings should be given as name=value, not {assignment}")
+        name, text = assignment.split("=", 1)
+        overrides[name.strip()] = parse_setting_value(name.strip(), text.strip())
+    return overrides
+
+
+def expand_inputs(inputs: list[str]) -> tuple[list[str], list[str]]:
+    gif_paths: list[str] = []
+    voice_paths: list[str] = []
+
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = sorted(glob.glob(os.path.join(glob.escape(item), "*.gif")))
+        elif os.path.isfile(item) or "#" in item:
+            matches = [item]
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if len(matches) == 0:
+                raise FileNotFoundError(f"Nothing matches {item}")
+
+        for match in matches:
+            match = match.replace("\\", "/")
+            if match.lower().endswith(".gif") and match not in gif_paths:
+                gif_paths.append(match)
+            elif match.lower().endswith(".wav") or "#" in match:
+                voice_paths.append(match)
+
+    return gif_paths, voice_paths
+
+
+def read_manifest(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as file:
+        if path.lower().endswith(".jsonl"):
+            entries = [json.loads(line) for line in file if line.strip() != ""]
+        else:
+            entries = json.load(file)
+
+    if isinstance(entries, dict):
+        entries = entries.get("jobs", [])
+    if not isinstance(entries, list):
+        raise ValueError(f"Job manifest {path} should hold a list of jobs")
+    return entries
+
+
+def make_manifest_jobs(manifest_path: str, base_settings: SoundifierSettings, default_voices: list[str],
+                       output_folder: str, do_gifs: bool) -> list[batch.BatchJob]:
+    manifest_folder = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path: str) -> str:
+        return os.path.join(manifest_folder, path).replace("\\", "/")
+
+    jobs = []
+    for number, entry in enumerate(read_manifest(manifest_path), start=1):
+        if "gif" not in entry:
+            raise ValueError(f"Job {number} in {manifest_path} has no gif")
+
+        gif_path = resolve(entry["gif"])
+        voice_paths = [resolve(voice) for voice in entry.get("voices", [])] or default_voices
+        if len(voice_paths) == 0:
+            raise ValueError(f"Job {number} in {manifest_path} has no voices")
+
+        output_base_name = batch.make_output_base_name(output_folder, gif_path)
+        output_audio_path = resolve(entry["output"]) if "output" in entry else output_base_name + ".wav"
+        output_gif_path: Optional[str] = output_base_name + ".gif" if do_gifs else None
+        if "output_gif" in entry:
+            output_gif_path = resolve(entry["output_gif"]) if entry["output_gif"] is not None else None
+
+        jobs.append(batch.BatchJob(gif_path, tuple(voice_paths), base_settings.snapshot(
+            output_audio_path=output_audio_path,
+            output_gif_path=output_gif_path,
+            **entry.get("settings", {})
+        )))
+
+    return jobs
+
+
+def make_summary(results: list[batch.BatchResult], workers: int, seconds: float, recorder: Recorder) -> dict:
+    return {
+        "workers": workers,
+        "seconds": round(seconds, 4),
+        "succeeded": sum(1 for result in results if result.succeeded),
+        "failed": sum(1 for result in results if not result.succeeded),
+        "resumed": sum(1 for result in results if result.resumed),
+        "render_cache": {
+            "hits": sum(1 for result in results if result.from_cache),
+            "misses": sum(1 for result in results if not result.from_cache and not result.resumed)
+        },
+        **recorder.get_summary(),
+        "jobs": [
+            {
+                "gif": result.job.gif_path,
+                "voices": list(result.job.voice_paths),
+                "output_audio_path": result.job.settings.output_audio_path,
+                "output_gif_path": result.job.settings.output_gif_path,
+                "seed": result.job.settings.seed,
+                "succeeded": result.succeeded,
+                "error": result.error,
+                "from_cache": result.from_cache,
+                "resumed": result.resumed,
+                "seconds": round(result.seconds, 4),
+                **summarize_events(result.events or [])
+            }
+            for result in results
+        ]
+    }
+
+
+def log_result(result: batch.BatchResult, done: int, total: int) -> None:
+    status = "resumed" if result.resumed else "saved" if result.succeeded else "failed"
+    message = f"[{done}/{total}] {'Already saved' if result.resumed else 'Saved' if result.succeeded else 'Failed'} {result.job.gif_path}"
+    if not result.succeeded:
+        message += f"\n\tCaused by: {result.error}"
+    log_event("job_finished", message, logging.INFO if result.succeeded else logging.WARNING, gif=result.job.gif_path,
+              output=result.job.settings.output_audio_path, status=status, error=result.error, done=done, total=total)
+
+
+def make_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="soundifier",
+        description="Soundify animated text box gifs without the GUI."
+    )
+    parser.add_argument("inputs", nargs="*",
+                        help="Gifs, folders of gifs or glob patterns. Wav files given here are used as voices.")
+    parser.add_argument("-v", "--voice", action="append", default=[],
+                        help="Voice sound to use (can be repeated, or a pattern with # for numbered files)")
+    parser.add_argument("-j", "--jobs", action="append", default=[],
+                        help="JSON or JSONL job manifest, each job listing a gif, voices and settings overrides")
+    parser.add_argument("-o", "--output", default=".", help="Folder to save the sounds in (default: current folder)")
+    parser.add_argument("-s", "--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a SoundifierSettings value for every job, e.g. --set speed=0.5")
+    parser.add_argument("-g", "--gifs", action="store_true", help="Also save speed-altered gifs")
+    parser.add_argument("-w", "--workers", type=int, default=batch.DEFAULT_WORKERS,
+                        help=f"How many jobs to render at once (default: {batch.DEFAULT_WORKERS})")
+    parser.add_argument("--restart", action="store_true",
+                        help="Render every job again, even ones an earlier run of the batch already saved")
+    parser.add_argument("--trace", help="Also save a timeline of every render stage, for chrome://tracing or Perfetto")
+    parser.add_argument("--log-json", action="store_true", help="Log one JSON object per line instead of plain text")
+    parser.add_argument("--summary", help="Where to write the JSON summary (default: soundifier_summary.json in the output folder)")
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = make_argument_parser()
+    args = parser.parse_args(argv)
+    configure_logging(args.log_json)
+
+    try:
+        gif_paths, input_voices = expand_inputs(args.inputs)
+        voice_paths = input_voices + args.voice
+
+        base_settings = SoundifierSettings("").snapshot(**{
+            "making_for_preview": False,
+            "stream_audio": True,
+            **parse_setting_overrides(args.set)
+        })
+
+        output_folder = args.output.replace("\\", "/").rstrip("/") or "."
+        os.makedirs(output_folder, exist_ok=True)
+
+        jobs: list[batch.BatchJob] = []
+        if len(gif_paths) > 0:
+            if len(voice_paths) == 0:
+                raise ValueError("No voices provided!")
+            jobs += batch.make_batch_jobs(gif_paths, voice_paths, base_settings, output_folder, args.gifs)
+        for manifest_path in args.jobs:
+            jobs += make_manifest_jobs(manifest_path, base_settings, voice_paths, output_folder, args.gifs)
+        batch.check_output_paths(jobs)
+
+        journal = BatchJournal(get_journal_path(output_folder), resume=not args.restart)
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        parser.error(str(e))
+
+    if len(jobs) == 0:
+        parser.error("No gifs provided!")
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    results = batch.render_batch(
+        jobs,
+        args.workers,
+        on_result=log_result,
+        journal=journal,
+        recorder=recorder
+    )
+    summary = make_summary(results, args.workers, time.perf_counter() - start, recorder)
+    if args.trace is not None:
+        recorder.write_trace(args.trace)
+
+    summary_path = args.summary or output_folder + "/soundifier_summary.json"
+    with open(summary_path, "w", encoding="utf-8") as file:
+        json.dump(summary, file, indent=2)
+    log_event("batch_finished",
+              f"Saved {summary['succeeded']}/{len(results)} sounds in {summary['seconds']:.2f}s "
+              f"({summary['resumed']} already saved by an earlier run, {summary['render_cache']['hits']} from the render cache), "
+              f"summary written to {summary_path}",
+              succeeded=summary["succeeded"], failed=summary["failed"], resumed=summary["resumed"],
+              render_cache_hits=summary["render_cache"]["hits"], seconds=summary["seconds"], summary=summary_path)
+
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import os
+import time
+from typing import Callable, Optional
+
+
+def remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def get_file_name(name: str) -> str:
+    return name
+
+
+def evict_files(directory: str, max_bytes: int, max_age: Optional[float] = None,
+                get_group: Callable[[str], str] = get_file_name) -> None:
+    # Drops the least recently used files of a cache folder until it fits in max_bytes, and anything not used for
+    # longer than max_age. Files that get_group puts together are kept or dropped together, and count as used when
+    # any of them was.
+    if not os.path.isdir(directory):
+        return
+
+    groups: dict[str, list] = {}
+    for name in os.listdir(directory):
+        full_path = directory + "/" + name
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            continue
+        group = groups.setdefault(get_group(name), [0.0, 0, []])
+        group[0] = max(group[0], stat.st_mtime)
+        group[1] += stat.st_size
+        group[2].append(full_path)
+
+    now = time.time()
+    kept = []
+    for group in groups.values():
+        if max_age is not None and now - group[0] > max_age:
+            for full_path in group[2]:
+                remove_quietly(full_path)
+        else:
+            kept.append(group)
+
+    total_size = sum(size for _, size, _ in kept)
+    for _, size, full_paths in sorted(kept):
+        if total_size <= max_bytes:
+            break
+        for full_path in full_paths:
+            remove_quietly(full_path)
+        total_size -= size
@@ -0,0 +1,69 @@
+import hashlib
+from typing import Callable, NamedTuple, Optional
+
+import numpy
+from PIL import Image, ImageSequence
+
+
+class FrameRecord(NamedTuple):
+    duration: int
+    changed: bool
+    content_hash: bytes
+
+
+def hash_frame(frame: Image.Image) -> bytes:
+    return hashlib.blake2b(frame.tobytes(), digest_size=16).digest()
+
+
+def analyze_gif_frames(gif: Image.Image, on_frame: Optional[Callable[[], None]] = None) -> list[FrameRecord]:
+    records: list[FrameRecord] = []
+    prev_hash: Optional[bytes] = None
+
+    for frame in ImageSequence.Iterator(gif):
+        if on_frame is not None:
+            on_frame()
+
+        content_hash = hash_frame(frame)
+        records.append(FrameRecord(frame.info['duration'], content_hash != prev_hash, content_hash))
+        prev_hash = content_hash
+
+    return records
+
+
+def shift_frames(column: numpy.ndarray, frames: int) -> numpy.ndarray:
+    # The column as seen from the frame that many frames earlier (or later when negative), False past either end
+    shifted = numpy.zeros_like(column)
+    if frames > 0:
+        shifted[frames:] = column[:-frames]
+    else:
+        shifted[:frames] = column[-frames:]
+    return shifted
+
+
+class FrameTimeline:
+    # The frame records split into columns, with the pauses found up front, so the timing passes can work on whole
+    # arrays. Frames are numbered from 0 here.
+    def __init__(self, records: list[FrameRecord]):
+        count = len(records)
+        self.durations = numpy.fromiter((record.duration for record in records), dtype=numpy.int64, count=count)
+        self.changed = numpy.fromiter((record.changed for record in records), dtype=bool, count=count)
+        # When each frame ends, in milliseconds from the start of the gif
+        self.moments = numpy.cumsum(self.durations)
+
+        # A pause is at least two frames in a row that don't change anything. These are the letters right before and
+        # right after one.
+        unchanged = ~self.changed
+        self.pause_before = self.changed & shift_frames(unchanged, -1) & shift_frames(unchanged, -2)
+        self.pause_after = self.changed & shift_frames(unchanged, 1) & shift_frames(unchanged, 2)
+
+        changing_frames = numpy.flatnonzero(self.changed)
+        self.last_changing_frame = int(changing_frames[-1]) if len(changing_frames) > 0 else -1
+        self.trailing_identical_frames = count - 1 - self.last_changing_frame
+
+        # The first frame is held up against the last one when counting letters, since that's how the gif loops
+        self.letter_changed = self.changed.copy()
+        if count > 0:
+            self.letter_changed[0] = records[0].content_hash != records[-1].content_hash
+
+    def __len__(self) -> int:
+        return len(self.durations)
@@ -0,0 +1,82 @@
+import hashlib
+import logging
+import os
+import struct
+from typing import Optional
+
+from disk_cache import evict_files
+from frame_analysis import FrameRecord
+from girlhelp import cache_path
+from instrumentation import log_event
+
+CACHE_VERSION = 1
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+HEADER = struct.Struct("<4sHI")
+RECORD = struct.Struct("<IB16s")
+MAGIC = b"UTFA"
+
+
+def get_cache_directory() -> str:
+    return cache_path("frame_analysis")
+
+
+def get_cache_file(gif_path: str) -> Optional[str]:
+    try:
+        stat = os.stat(gif_path)
+    except OSError:
+        return None
+
+    key = f"{os.path.abspath(gif_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+    return get_cache_directory() + "/" + hashlib.sha1(key.encode("utf-8")).hexdigest() + ".frames"
+
+
+def load_frame_records(gif_path: str) -> Optional[list[FrameRecord]]:
+    cache_file = get_cache_file(gif_path)
+    if cache_file is None or not os.path.isfile(cache_file):
+        return None
+
+    try:
+        with open(cache_file, "rb") as file:
+            data = file.read()
+        magic, version, frame_count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != CACHE_VERSION or len(data) != HEADER.size + frame_count * RECORD.size:
+            return None
+
+        records = [
+            FrameRecord(duration, bool(changed), content_hash)
+            for duration, changed, content_hash in RECORD.iter_unpack(data[HEADER.size:])
+        ]
+        # Touch the file so eviction drops the least recently used analyses first
+        os.utime(cache_file)
+        return records
+    except (OSError, struct.error):
+        return None
+
+
+def store_frame_records(gif_path: str, records: list[FrameRecord]) -> None:
+    cache_file = get_cache_file(gif_path)
+    if cache_file is None:
+        return
+
+    data = bytearray(HEADER.pack(MAGIC, CACHE_VERSION, len(records)))
+    for record in records:
+        data += RECORD.pack(record.duration, record.changed, record.content_hash)
+
+    try:
+        os.makedirs(get_cache_directory(), exist_ok=True)
+        temporary_file = cache_file + ".tmp"
+        with open(temporary_file, "wb") as file:
+            file.write(data)
+        os.replace(temporary_file, cache_file)
+    except OSError as e:
+        log_event("frame_cache_failed", f"Couldn't cache frame analysis for {gif_path}.\n\tCaused by: {e}",
+                  logging.WARNING, gif=gif_path, error=str(e))
+        return
+
+    evict_frame_records()
+
+
+def evict_frame_records(max_bytes: int = CACHE_MAX_BYTES, max_age: float = CACHE_MAX_AGE) -> None:
+    evict_files(get_cache_directory(), max_bytes, max_age)
@@ -0,0 +1,262 @@
+import io
+import itertools
+import os
+import struct
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional
+
+from PIL import Image, ImageSequence
+
+EXTENSION_INTRODUCER = 0x21
+IMAGE_SEPARATOR = 0x2C
+TRAILER = 0x3B
+GRAPHIC_CONTROL_LABEL = 0xF9
+PLAIN_TEXT_LABEL = 0x01
+
+DISPOSE_TO_BACKGROUND = 2
+DISPOSE_TO_PREVIOUS = 3
+
+Rectangle = tuple[int, int, int, int]
+
+
+class GifHeader(NamedTuple):
+    # Logical screen descriptor and global colour table, without the signature
+    screen: bytes
+    width: int
+    height: int
+
+
+class GifFrame(NamedTuple):
+    # Application and comment extensions that came before the frame. They don't belong to it, so they're written
+    # even when the frame isn't.
+    preamble: bytes
+    # The 4 data bytes of the graphic control extension: packed fields, delay and transparent colour index
+    control: Optional[bytes]
+    # Plain text extensions, image descriptor, local colour table and LZW data, exactly as they were encoded
+    image: bytes
+    rectangle: Rectangle
+
+    @property
+    def disposal(self) -> int:
+        return (self.control[0] >> 2) & 7 if self.control is not None else 0
+
+    @property
+    def transparent(self) -> bool:
+        return self.control is not None and self.control[0] & 1 == 1
+
+
+def get_colour_table_size(packed: int) -> int:
+    return 3 * 2 ** ((packed & 7) + 1) if packed & 0x80 else 0
+
+
+def read_exactly(file: BinaryIO, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("Gif ended unexpectedly")
+    return data
+
+
+def read_sub_blocks(file: BinaryIO, keep_data: bool = True) -> bytes:
+    blocks = []
+    while True:
+        size = read_exactly(file, 1)
+        if keep_data:
+            blocks.append(size)
+        if size[0] == 0:
+            return b"".join(blocks)
+        if keep_data:
+            blocks.append(read_exactly(file, size[0]))
+        else:
+            file.seek(size[0], os.SEEK_CUR)
+
+
+def read_gif_header(file: BinaryIO) -> GifHeader:
+    signature = read_exactly(file, 6)
+    if signature not in (b"GIF87a", b"GIF89a"):
+        raise ValueError("Not a gif")
+
+    screen = read_exactly(file, 7)
+    width, height, packed = struct.unpack("<HHB", screen[:5])
+    return GifHeader(screen + read_exactly(file, get_colour_table_size(packed)), width, height)
+
+
+def read_gif_frames(file: BinaryIO, keep_data: bool = True) -> Iterator[GifFrame]:
+    # Walks the blocks after the header one frame at a time, so only a single encoded frame is ever held
+    preamble = []
+    control: Optional[bytes] = None
+    plain_text = []
+
+    while True:
+        introducer = file.read(1)
+        if len(introducer) == 0 or introducer[0] == TRAILER:
+            return
+
+        if introducer[0] == EXTENSION_INTRODUCER:
+            label = read_exactly(file, 1)
+            if label[0] == GRAPHIC_CONTROL_LABEL:
+                data = read_sub_blocks(file)
+                control = data[1:5] if len(data) >= 6 else None
+            elif label[0] == PLAIN_TEXT_LABEL:
+                plain_text.append(introducer + label + read_sub_blocks(file, keep_data))
+            else:
+                preamble.append(introducer + label + read_sub_blocks(file, keep_data))
+
+        elif introducer[0] == IMAGE_SEPARATOR:
+            descriptor = read_exactly(file, 9)
+            left, top, width, height, packed = struct.unpack("<HHHHB", descriptor)
+            colour_table = read_exactly(file, get_colour_table_size(packed))
+            minimum_code_size = read_exactly(file, 1)
+            data = read_sub_blocks(file, keep_data)
+
+            image = b"".join(plain_text) + introducer + descriptor + colour_table + minimum_code_size + data
+            yield GifFrame(b"".join(preamble), control, image, (left, top, left + width, top + height))
+            preamble = []
+            control = None
+            plain_text = []
+
+        else:
+            raise ValueError(f"Unknown gif block {introducer[0]:#04x}")
+
+
+def make_graphic_control(control: Optional[bytes], delay: int, disposal: Optional[int] = None) -> bytes:
+    packed, _, transparent_index = struct.unpack("<BHB", control) if control is not None else (0, 0, 0)
+    if disposal is not None:
+        packed = (packed & ~0x1C) | (disposal << 2)
+    return bytes([EXTENSION_INTRODUCER, GRAPHIC_CONTROL_LABEL, 4]) + struct.pack("<BHB", packed, delay, transparent_index) + b"\0"
+
+
+def get_frame_delays(durations: list[Optional[float]]) -> list[int]:
+    # Gif delays are in hundredths of a second. Rounding the running total instead of every frame on its own keeps the
+    # gif from drifting away from the sound over a long text box.
+    delays = []
+    elapsed = 0.0
+    written = 0
+    for duration in durations:
+        if duration is None:
+            continue
+        elapsed += duration
+        delay = min(max(round(elapsed / 10) - written, 0), 0xFFFF)
+        delays.append(delay)
+        written += delay
+    return delays
+
+
+def combine_rectangles(first: Optional[Rectangle], second: Rectangle) -> Rectangle:
+    if first is None:
+        return second
+    return min(first[0], second[0]), min(first[1], second[1]), max(first[2], second[2]), max(first[3], second[3])
+
+
+def contains_rectangle(outer: Rectangle, inner: Rectangle) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def get_dirty_area_after(dirty: Optional[Rectangle], frame: GifFrame) -> Optional[Rectangle]:
+    # The area of the canvas that might not be background anymore once the frame has been shown and disposed of.
+    # Viewers don't agree on what restoring to the previous frame means (Pillow keeps a first frame that asks for it),
+    # so only restoring to the background counts as clearing anything.
+    drawn = combine_rectangles(dirty, frame.rectangle)
+    if frame.disposal == DISPOSE_TO_BACKGROUND and contains_rectangle(frame.rectangle, drawn):
+        return None
+    return drawn
+
+
+def can_copy_encoded_frames(header: GifHeader, frames: Iterator[GifFrame], durations: list[Optional[float]]) -> bool:
+    # Encoded frames can only be copied as long as they're drawn over the same canvas they were made for. Dropping a
+    # frame changes the canvas underneath the next one, until either a frame covers all of it or both canvases have
+    # been cleared back to the background.
+    in_sync = True
+    source_dirty: Optional[Rectangle] = None
+    output_dirty: Optional[Rectangle] = None
+    written_any = False
+    screen = (0, 0, header.width, header.height)
+
+    for frame_number, (frame, duration) in enumerate(zip(frames, durations)):
+        if duration is None:
+            in_sync = False
+            source_dirty = get_dirty_area_after(source_dirty, frame)
+        else:
+            # A first frame is treated differently when it restores to the previous one, so none can become first
+            if frame.disposal == DISPOSE_TO_PREVIOUS and not written_any and frame_number > 0:
+                return False
+            covers_screen = contains_rectangle(frame.rectangle, screen) and not frame.transparent
+            if not in_sync and not (covers_screen and frame.disposal != DISPOSE_TO_PREVIOUS):
+                return False
+            in_sync = True
+            written_any = True
+            source_dirty = get_dirty_area_after(source_dirty, frame)
+            output_dirty = get_dirty_area_after(output_dirty, frame)
+
+        if source_dirty is None and output_dirty is None:
+            in_sync = True
+
+    return True
+
+
+def encode_full_frame(frame: Image.Image) -> tuple[Optional[bytes], bytes]:
+    # Encodes a fully drawn frame on its own, then moves its global colour table into the image as a local one so it
+    # can be spliced into another gif
+    buffer = io.BytesIO()
+    frame.save(buffer, format="GIF")
+    buffer.seek(0)
+
+    header = read_gif_header(buffer)
+    encoded = next(read_gif_frames(buffer))
+    screen_packed = header.screen[4]
+    colour_table = header.screen[7:]
+
+    image = encoded.image
+    if image[9] & 0x80 == 0 and len(colour_table) > 0:
+        image = image[:9] + bytes([image[9] | 0x80 | (screen_packed & 7)]) + colour_table + image[10:]
+    return encoded.control, image
+
+
+def decode_full_frames(path: str) -> Iterator[Image.Image]:
+    with Image.open(path) as gif:
+        yield from ImageSequence.Iterator(gif)
+
+
+def write_retimed_gif_to(source_path: str, output: BinaryIO, durations: list[Optional[float]],
+                         on_frame: Optional[Callable[[], None]] = None) -> None:
+    # Writes a copy of the gif where every frame lasts as long as its entry in durations (in milliseconds) and frames
+    # with no duration are left out. Frames are copied still encoded whenever that draws the same thing; otherwise
+    # every kept frame is drawn out in full and re-encoded one at a time.
+    with open(source_path, "rb") as source:
+        header = read_gif_header(source)
+        copy_encoded = can_copy_encoded_frames(header, read_gif_frames(source, keep_data=False), durations)
+
+    delays = iter(get_frame_delays(durations))
+
+    with open(source_path, "rb") as source:
+        read_gif_header(source)
+        output.write(b"GIF89a" + header.screen)
+
+        decoded = itertools.repeat(None) if copy_encoded else decode_full_frames(source_path)
+        for frame, image, duration in zip(read_gif_frames(source), decoded, durations):
+            if on_frame is not None:
+                on_frame()
+
+            output.write(frame.preamble)
+            if duration is None:
+                continue
+
+            if copy_encoded:
+                output.write(make_graphic_control(frame.control, next(delays)))
+                output.write(frame.image)
+            else:
+                control, encoded_image = encode_full_frame(image)
+                output.write(make_graphic_control(control, next(delays), DISPOSE_TO_BACKGROUND))
+                output.write(encoded_image)
+
+        output.write(bytes([TRAILER]))
+
+
+def write_retimed_gif(source_path: str, output_path: str, durations: list[Optional[float]],
+                      on_frame: Optional[Callable[[], None]] = None) -> None:
+    temporary_path = output_path + ".tmp"
+    try:
+        with open(temporary_path, "wb") as output:
+            write_retimed_gif_to(source_path, output, durations, on_frame)
+        os.replace(temporary_path, output_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
@@ -1,7 +1,22 @@
 import sys
 import os
 
+# Points every disk cache somewhere else, like a throwaway folder for the benchmark
+CACHE_DIRECTORY_VARIABLE = "SOUNDIFIER_CACHE_DIR"
+
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
-    return os.path.join(base_path, relative_path).replace("\\", "/")
\ No newline at end of file
+    return os.path.join(base_path, relative_path).replace("\\", "/")
+
+def cache_path(*parts):
+    """ Get a path inside the per-user cache directory, works for dev and for PyInstaller """
+    if os.environ.get(CACHE_DIRECTORY_VARIABLE):
+        return os.path.join(os.environ[CACHE_DIRECTORY_VARIABLE], *parts).replace("\\", "/")
+    if sys.platform == "win32":
+        base_path = os.environ.get("LOCALAPPDATA", os.path.expanduser("~/AppData/Local"))
+    elif sys.platform == "darwin":
+        base_path = os.path.expanduser("~/Library/Caches")
+    else:
+        base_path = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base_path, "UTDR Text Box Soundifier", *parts).replace("\\", "/")
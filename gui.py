@@ -1,23 +1,48 @@
+import multiprocessing
 import os
 import random
 import sys
-from typing import List, Dict
+from typing import List, Dict, TYPE_CHECKING
 
-from PyQt6.QtCore import QSize, Qt, QUrl
+import startup_timing
+
+# Before anything heavy is imported, so it can all be timed
+startup_timing.start_if_requested(sys.argv)
+
+from PyQt6.QtCore import QSize, Qt, QUrl, QThread, pyqtSignal, QBuffer, QByteArray, QIODevice, QTimer, QObject
 from PyQt6.QtGui import QMovie, QPixmap, QFont, QIcon, QDesktopServices, QDoubleValidator, QIntValidator, QCursor
-from PyQt6.QtMultimedia import QSoundEffect
 from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QListWidget, QFrame, \
     QSizePolicy, QComboBox, QCheckBox, QAbstractItemView, QFileDialog, QScrollArea, QSlider, QLineEdit, QPlainTextEdit
 
-import processor
+import batch
+import character_index
+from batch_journal import BatchJournal, get_journal_path
+from instrumentation import configure_logging
+from preview_cache import PreviewCache, get_gif_size, make_movie
+from render_scheduler import RenderScheduler, RenderTask, PREVIEW, EXPORT, SUCCEEDED, FAILED, CANCELLED
 import settings
 from settings import SoundifierSettings
 from girlhelp import resource_path
 
+# The audio and image stack (processor, pydub, PIL, numpy and QtMultimedia) takes longer to load than everything
+# else put together, so it's only imported once the window is up
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+    from PyQt6.QtMultimedia import QSoundEffect, QAudioSink, QAudioFormat
+    import processor
+
 VERSION = "1.0.4"
 
-CHARACTERS = {}
+CHARACTERS: Dict[str, character_index.CharacterEntry] = {}
+LOADED_CHARACTERS = {}
 DEFAULT_UNIVERSES = ["Basic", "Undertale", "Deltarune"]
+# Frame rate, channels and sample width the voices are converted to. None keeps whatever the voices have.
+OUTPUT_FORMATS = {
+    "Same as voices": (None, None, None),
+    "Draft (22 kHz)": (22050, None, None),
+    "Master (48 kHz)": (48000, None, None),
+    "Master (48 kHz, 32-bit)": (48000, None, 4)
+}
 
 class VoiceSettings:
     def __init__(self, interval, min_pitch, max_pitch, pitch_chance):
@@ -56,6 +81,75 @@ class CharacterWithVariant(BasicCharacter):
     def get_variant(self):
         return self.variant
 
+class RenderSignals(QObject):
+    # The scheduler tells its listeners about tasks from its own threads, and these signals bring that back to the
+    # widgets on the GUI thread
+    started = pyqtSignal(object)
+    progressed = pyqtSignal(object)
+    finished = pyqtSignal(object)
+
+    def relay(self, event, task):
+        getattr(self, event).emit(task)
+
+class AudioStackLoadThread(QThread):
+    def run(self):
+        try:
+            import processor
+            import PyQt6.QtMultimedia
+        except Exception as e:
+            print(f"Couldn't load the audio stack in the background.\n\tCaused by: {e}")
+
+class PreviewPlayer:
+    # Plays a rendered preview straight from memory instead of saving it and loading it back in
+    SAMPLE_FORMATS = {
+        1: "UInt8",
+        2: "Int16",
+        4: "Int32"
+    }
+
+    def __init__(self):
+        self.sink: "QAudioSink | None" = None
+        self.buffer = QBuffer()
+
+    def get_audio_format(self, audio: "AudioSegment") -> "QAudioFormat":
+        from PyQt6.QtMultimedia import QAudioFormat
+        audio_format = QAudioFormat()
+        audio_format.setSampleRate(audio.frame_rate)
+        audio_format.setChannelCount(audio.channels)
+        audio_format.setSampleFormat(getattr(QAudioFormat.SampleFormat, self.SAMPLE_FORMATS[audio.sample_width]))
+        return audio_format
+
+    def load(self, audio: "AudioSegment"):
+        from PyQt6.QtMultimedia import QAudioSink, QMediaDevices
+        self.stop()
+
+        device = QMediaDevices.defaultAudioOutput()
+        if audio.sample_width not in self.SAMPLE_FORMATS:
+            audio = audio.set_sample_width(2)
+        audio_format = self.get_audio_format(audio)
+        if not device.isFormatSupported(audio_format):
+            # Unlike QSoundEffect, a sink doesn't convert for us
+            preferred = device.preferredFormat()
+            audio = audio.set_frame_rate(preferred.sampleRate()).set_channels(min(max(preferred.channelCount(), 1), 2)).set_sample_width(2)
+            audio_format = self.get_audio_format(audio)
+
+        self.buffer = QBuffer()
+        self.buffer.setData(QByteArray(audio.raw_data))
+        self.buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+        self.sink = QAudioSink(device, audio_format)
+        self.sink.setVolume(1.0)
+
+    def play(self):
+        if self.sink is None:
+            return
+        self.sink.stop()
+        self.buffer.seek(0)
+        self.sink.start(self.buffer)
+
+    def stop(self):
+        if self.sink is not None:
+            self.sink.stop()
+
 class TextBoxDisplayAndImporter(QLabel):
     def __init__(self, parent):
         super().__init__(parent)
@@ -95,7 +189,8 @@ class MainWindow(QWidget):
 
     gif_paths: List[str]
     preview_index: int
-    movie: QMovie
+    movie: QMovie | None
+    preview_cache: PreviewCache
 
     preview_index_display: QLabel
 
@@ -104,6 +199,9 @@ class MainWindow(QWidget):
     remove_batch_file_button: QPushButton
     batch_file_list: QListWidget
 
+    batch_workers_field: QLineEdit
+    batch_status_label: QLabel
+
     batch_mode_only_widgets: List[QWidget]
 
     character_dropdown: QComboBox
@@ -128,6 +226,7 @@ class MainWindow(QWidget):
     min_pitch_field: QLineEdit
     max_pitch_field: QLineEdit
     pitch_chance_field: QLineEdit
+    pitch_steps_field: QLineEdit
 
     speed_slider: QSlider
     speed_field: QLineEdit
@@ -151,20 +250,42 @@ class MainWindow(QWidget):
     save_button: QPushButton
     save_gif_button: QPushButton
 
-    sound: QSoundEffect
+    sound: "QSoundEffect | None"
+    preview_player: PreviewPlayer
     previewing: bool
     previewing_altered_gif: bool
 
+    render_scheduler: RenderScheduler
+    render_signals: RenderSignals
+    preview_task: RenderTask | None
+    export_task: RenderTask | None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.settings = SoundifierSettings(get_preview_path())
+        # One seed for the whole session, so previews and saves of the same settings sound the same
+        self.settings.seed = random.randrange(2 ** 32)
+        self.random = random.Random(self.settings.seed)
 
-        self.sound = QSoundEffect()
-        self.sound.setVolume(1.0)
+        self.sound = None
+        self.audio_stack_load_thread = None
+        self.preview_player = PreviewPlayer()
         self.previewing = False
         self.previewing_altered_gif = False
         self.gif_paths = []
+        self.movie = None
+        self.preview_cache = PreviewCache()
+
+        # Previews and exports share one scheduler, which always keeps a thread free for previews
+        self.render_scheduler = RenderScheduler()
+        self.render_signals = RenderSignals()
+        self.render_scheduler.add_listener(self.render_signals.relay)
+        self.render_signals.progressed.connect(self.export_progressed)
+        self.render_signals.finished.connect(self.preview_render_finished)
+        self.render_signals.finished.connect(self.export_finished)
+        self.preview_task = None
+        self.export_task = None
 
         # set the window title
         self.setWindowTitle("UTDR Text Box Soundifier")
@@ -220,8 +341,21 @@ class MainWindow(QWidget):
         batch_mode_explanation = QLabel("<em>All exports in Batch Mode will use the same voice and settings for every text box!</em>")
         batch_mode_explanation.setWordWrap(True)
 
+        batch_workers_layout = QHBoxLayout()
+
+        batch_workers_label = QLabel("Save at once:")
+
+        self.batch_workers_field = QLineEdit(str(batch.DEFAULT_WORKERS))
+        self.batch_workers_field.setValidator(QIntValidator(1, 64))
+        self.batch_workers_field.setFixedWidth(30)
+
+        batch_workers_layout.addWidget(batch_workers_label)
+        batch_workers_layout.addWidget(self.batch_workers_field)
+        batch_workers_layout.addStretch()
+
         batch_mode_layout.addLayout(batch_file_manage_layout)
         batch_mode_layout.addWidget(self.batch_file_list)
+        batch_mode_layout.addLayout(batch_workers_layout)
         batch_mode_layout.addWidget(batch_mode_explanation)
 
         voice_layout = make_config_section("    Voice")[0]
@@ -333,6 +467,20 @@ class MainWindow(QWidget):
         pitch_layout.addWidget(pitch_chance_label)
         pitch_layout.addWidget(self.pitch_chance_field)
 
+        pitch_steps_layout = QHBoxLayout()
+
+        pitch_steps_label = QLabel("Pitch steps:")
+
+        self.pitch_steps_field = make_ms_field(self.settings.pitch_steps, self.change_pitch_steps)
+        self.pitch_steps_field.setToolTip("Snap random pitches to this many steps, which is faster for long text boxes. 0 keeps them exact.")
+
+        pitch_steps_explanation_label = QLabel("<em>(0 = exact)</em>")
+
+        pitch_steps_layout.addWidget(pitch_steps_label)
+        pitch_steps_layout.addWidget(self.pitch_steps_field)
+        pitch_steps_layout.addWidget(pitch_steps_explanation_label)
+        pitch_steps_layout.addStretch()
+
         voice_layout.addLayout(character_layout)
         voice_layout.addLayout(variant_layout)
         voice_layout.addWidget(self.universe_scroll_area)
@@ -340,6 +488,7 @@ class MainWindow(QWidget):
         voice_layout.addWidget(self.voice_file_list)
         voice_layout.addLayout(interval_layout)
         voice_layout.addLayout(pitch_layout)
+        voice_layout.addLayout(pitch_steps_layout)
 
         processing_layout = make_config_section("Processing")[0]
 
@@ -415,6 +564,19 @@ class MainWindow(QWidget):
         silence_cutoff_layout.addWidget(silence_cutoff_end_label)
         silence_cutoff_layout.addStretch()
 
+        output_format_layout = QHBoxLayout()
+
+        output_format_label = QLabel("Audio format:")
+
+        output_format_dropdown = QComboBox(self)
+        output_format_dropdown.addItems(OUTPUT_FORMATS)
+        output_format_dropdown.setToolTip("Drafts render quicker, masters come out at a higher quality than most voices have.")
+        output_format_dropdown.currentTextChanged.connect(self.change_output_format)
+
+        output_format_layout.addWidget(output_format_label)
+        output_format_layout.addWidget(output_format_dropdown)
+        output_format_layout.addStretch()
+
         olp_toggle_layout = QHBoxLayout()
 
         overlap_prevention_label = QLabel("<strong>Overlap Prevention:</strong>")
@@ -521,6 +683,7 @@ class MainWindow(QWidget):
         processing_layout.addLayout(easy_align_layout)
         processing_layout.addLayout(extra_noise_layout)
         processing_layout.addLayout(silence_cutoff_layout)
+        processing_layout.addLayout(output_format_layout)
         processing_layout.addWidget(make_horizontal_line())
         processing_layout.addLayout(olp_toggle_layout)
         processing_layout.addLayout(olp_max_overlap_layout)
@@ -595,6 +758,9 @@ class MainWindow(QWidget):
         # signature.setStyleSheet("QLabel { color: #ff9bee; background-color: #000000; }")
         signature.setFont(QFont("Arial", 11))
 
+        self.batch_status_label = QLabel()
+        self.batch_status_label.setWordWrap(True)
+
         # signature_layout.addWidget(version_label)
         # signature_layout.addWidget(signature)
 
@@ -612,6 +778,7 @@ class MainWindow(QWidget):
         footer_layout.addWidget(signature)
         # footer_layout.addLayout(signature_layout)
         footer_layout.addStretch()
+        footer_layout.addWidget(self.batch_status_label)
         footer_layout.addWidget(self.preview_button)
         footer_layout.addWidget(make_vertical_line())
         footer_layout.addWidget(self.save_button)
@@ -644,7 +811,10 @@ class MainWindow(QWidget):
             pitch_mid_label,
             self.max_pitch_field,
             pitch_chance_label,
-            self.pitch_chance_field
+            self.pitch_chance_field,
+            pitch_steps_label,
+            self.pitch_steps_field,
+            pitch_steps_explanation_label
         ]
 
         self.batch_mode_only_widgets = [
@@ -658,6 +828,8 @@ class MainWindow(QWidget):
             add_batch_file_button,
             self.remove_batch_file_button,
             self.batch_file_list,
+            batch_workers_label,
+            self.batch_workers_field,
             batch_mode_explanation
         ]
 
@@ -677,6 +849,19 @@ class MainWindow(QWidget):
 
         # show the window
         self.show()
+        startup_timing.mark("window shown")
+
+        # once it's had a chance to draw itself
+        QTimer.singleShot(0, self.load_audio_stack)
+
+    def load_audio_stack(self):
+        self.audio_stack_load_thread = AudioStackLoadThread()
+        self.audio_stack_load_thread.finished.connect(self.audio_stack_loaded)
+        self.audio_stack_load_thread.start()
+
+    def audio_stack_loaded(self):
+        startup_timing.mark("audio stack loaded")
+        startup_timing.finish()
 
     def set_gif_paths(self, new_gif_paths, reset_preview_index=True):
         self.gif_paths = new_gif_paths.copy()
@@ -695,14 +880,42 @@ class MainWindow(QWidget):
         self.preview_index_display.setText(f"{self.preview_index + 1}/{len(self.gif_paths)}")
         self.end_preview()
 
-    def set_movie(self, movie_path):
-        print(f"Setting movie to {movie_path}")
-        self.movie: QMovie = QMovie(movie_path)
-        self.movie.updated.connect(self.movie_signal)
-        as_pixmap = QPixmap(movie_path)
+        # Previous and Next are usually what gets pressed next
+        if len(self.gif_paths) > 1:
+            self.preview_cache.prefetch([self.gif_paths[(self.preview_index + step) % len(self.gif_paths)] for step in (1, -1)])
+
+    def set_movie(self, movie_path, movie_data: bytes | None = None):
+        if movie_data is None:
+            print(f"Setting movie to {movie_path}")
+            cached = self.preview_cache.get_movie(movie_path)
+            if cached is None:
+                print(f"Couldn't read {movie_path}, it may have been moved or deleted")
+                return
+            movie, movie_size = cached
+        else:
+            print(f"Setting movie to altered {movie_path}")
+            movie, movie_size = make_movie(movie_data), get_gif_size(movie_data)
+
+        # Cached movies get shown again later, so the one going away is stopped and let go of instead of left running.
+        # A movie playing from memory only starts over if its buffer is rewound too.
+        if self.movie is not None and self.movie is not movie:
+            self.movie.stop()
+            self.movie.device().seek(0)
+            self.movie.updated.disconnect(self.movie_signal)
+        if self.movie is not movie:
+            movie.updated.connect(self.movie_signal)
+        self.movie = movie
         # self.movie.setSpeed(round(self.settings.speed * 100))
 
-        movie_aspect_ratio = as_pixmap.width() / as_pixmap.height()
+        if movie_size is None:
+            # Not a header we know, so let Qt work it out the slow way
+            as_pixmap = QPixmap()
+            if movie_data is None:
+                as_pixmap.load(movie_path)
+            else:
+                as_pixmap.loadFromData(movie_data, "GIF")
+            movie_size = (as_pixmap.width(), as_pixmap.height())
+        movie_aspect_ratio = movie_size[0] / movie_size[1]
 
         movie_final_height = 200
         movie_final_width = round(movie_final_height * movie_aspect_ratio)
@@ -725,8 +938,7 @@ class MainWindow(QWidget):
 
     def movie_signal(self):
         if self.previewing and self.movie.currentFrameNumber() == 0:
-            self.sound.stop()
-            self.sound.play()
+            self.preview_player.play()
 
     def add_batch_file(self):
         add_gifs = self.select_gifs_with_dialog()
@@ -823,15 +1035,22 @@ class MainWindow(QWidget):
     def recheck_eligibility(self):
         self.end_preview()
         eligible = len(self.voice_files) != 0 and not (self.settings.skip_punctuation and self.settings.full_text == "")
-        self.save_button.setDisabled(not eligible)
+        self.save_button.setDisabled(not eligible or self.export_task is not None)
         self.preview_button.setDisabled(not eligible)
         return eligible
 
     def recheck_gif_eligibility(self):
         eligible = self.recheck_eligibility() and (self.settings.speed != 1 or (self.settings.mettatonize and self.settings.interval != 1))
-        self.save_gif_button.setDisabled(not eligible)
+        self.save_gif_button.setDisabled(not eligible or self.export_task is not None)
         return eligible
 
+    def update_save_buttons(self):
+        # Unlike the rechecks, this leaves the preview alone, so previews can keep going while exports come and go
+        eligible = len(self.voice_files) != 0 and not (self.settings.skip_punctuation and self.settings.full_text == "")
+        gif_eligible = eligible and (self.settings.speed != 1 or (self.settings.mettatonize and self.settings.interval != 1))
+        self.save_button.setDisabled(not eligible or self.export_task is not None)
+        self.save_gif_button.setDisabled(not gif_eligible or self.export_task is not None)
+
     def configure_universes(self, checked):
         for hideable_thing in self.universe_incompatible_widgets:
             hideable_thing.setHidden(checked)
@@ -854,7 +1073,7 @@ class MainWindow(QWidget):
         if is_custom:
             self.apply_voice_settings(VoiceSettings(1, 1, 1, 1))
         else:
-            character: BasicCharacter = CHARACTERS[selected_character]
+            character: BasicCharacter = get_character(selected_character)
             self.voice_files = character.voice_paths.copy()
 
             self.variant_label.setText(character.get_variant_name() + ": ")
@@ -889,7 +1108,7 @@ class MainWindow(QWidget):
         self.voice_file_list.addItems(self.voice_files)
 
     def toggle_variant(self):
-        new_character = CHARACTERS[self.character_dropdown.currentText()].maybe_get_variant(self.variant_checkbox.isChecked())
+        new_character = get_character(self.character_dropdown.currentText()).maybe_get_variant(self.variant_checkbox.isChecked())
         self.voice_files = new_character.voice_paths.copy()
         self.update_voice_file_list_widget()
 
@@ -912,14 +1131,14 @@ class MainWindow(QWidget):
                 self.voice_files.append(new_file)
 
         self.update_voice_file_list_widget()
-        self.recheck_eligibility()
+        self.recheck_eligibility_and_refresh_preview()
 
     def remove_voice_sfx(self):
         for remove_path in self.voice_file_list.selectedItems():
             self.voice_files.remove(remove_path.text())
         self.update_voice_file_list_widget()
         self.remove_voice_file_button.setDisabled(True)
-        self.recheck_eligibility()
+        self.recheck_eligibility_and_refresh_preview()
 
     def change_interval(self, interval):
         self.settings.interval = interval
@@ -964,21 +1183,28 @@ class MainWindow(QWidget):
     def change_min_pitch(self, new_min):
         try:
             self.settings.min_pitch = float(new_min)
-            self.end_preview()
+            self.refresh_preview()
         except ValueError:
             pass
 
     def change_max_pitch(self, new_max):
         try:
             self.settings.max_pitch = float(new_max)
-            self.end_preview()
+            self.refresh_preview()
         except ValueError:
             pass
 
     def change_pitch_chance(self, new_chance):
         try:
             self.settings.random_pitch_chance = float(new_chance)
-            self.end_preview()
+            self.refresh_preview()
+        except ValueError:
+            pass
+
+    def change_pitch_steps(self, new_steps):
+        try:
+            self.settings.pitch_steps = max(0, int(new_steps))
+            self.refresh_preview()
         except ValueError:
             pass
 
@@ -1023,25 +1249,29 @@ class MainWindow(QWidget):
         except ValueError:
             pass
 
+    def change_output_format(self, new_format):
+        self.settings.output_frame_rate, self.settings.output_channels, self.settings.output_sample_width = OUTPUT_FORMATS[new_format]
+        self.refresh_preview()
+
     def toggle_olp(self, checked):
         self.settings.do_overlap_prevention = checked
 
         for widget in self.overlap_prevention_details:
             widget.setDisabled(not checked)
 
-        self.end_preview()
+        self.refresh_preview()
 
     def change_max_overlap(self, new_max):
         try:
             self.settings.olp_hard_cutoff_leniency = int(new_max)
-            self.end_preview()
+            self.refresh_preview()
         except ValueError:
             pass
 
     def change_fade_duration(self, new_duration):
         try:
             self.settings.olp_fade_duration = int(new_duration)
-            self.end_preview()
+            self.refresh_preview()
         except ValueError:
             pass
 
@@ -1065,47 +1295,93 @@ class MainWindow(QWidget):
         self.settings.full_text = self.full_transcript.toPlainText()
         self.recheck_eligibility()
 
-    def toggle_preview(self, checked):
-        self.previewing = checked
-        if checked:
-            doing_gif = self.settings.speed != 1 or (self.settings.mettatonize and self.settings.interval != 1)
+    def refresh_preview(self):
+        # Mix settings don't change the gif's timings, so a running preview is rendered again from the cached stages
+        # instead of being ended
+        if self.preview_button.isChecked():
+            self.start_preview_render()
+        else:
+            self.end_preview()
 
-            self.settings.making_for_preview = True
-            self.settings.output_audio_path = get_preview_path()
-            self.settings.output_gif_path = resource_path("assets/preview_output.gif") if doing_gif else None
-            processor.make_and_save_blip_track(self.gif_paths[self.preview_index], self.settings, *self.voice_files)
-            self.settings.making_for_preview = False
-            self.sound = QSoundEffect()
-            self.sound.setSource(QUrl.fromLocalFile(self.settings.output_audio_path))
-            self.preview_button.setText("End Preview")
+    def recheck_eligibility_and_refresh_preview(self):
+        previewing = self.preview_button.isChecked()
+        if self.recheck_eligibility() and previewing:
+            self.preview_button.setChecked(True)
+            self.start_preview_render()
 
-            if doing_gif:
-                self.set_movie(resource_path("assets/preview_output.gif"))
-                self.previewing_altered_gif = True
-            else:
-                self.movie.jumpToFrame(0)
+    def toggle_preview(self, checked):
+        self.previewing = False
+        if checked:
+            self.start_preview_render()
         else:
             self.end_preview()
         # self.nag()
 
+    def start_preview_render(self):
+        doing_gif = self.settings.speed != 1 or (self.settings.mettatonize and self.settings.interval != 1)
+
+        render_settings = self.settings.snapshot(making_for_preview=True)
+        self.settings.making_for_preview = False
+        gif_path = self.gif_paths[self.preview_index]
+        voice_paths = self.voice_files.copy()
+
+        def render(task):
+            import processor
+            return processor.render_preview(gif_path, render_settings, *voice_paths, should_stop=task.is_cancelled,
+                                            with_gif=doing_gif)
+
+        # A stale preview is cancelled rather than waited on, and the new one can start next to it while it stops
+        if self.preview_task is not None:
+            self.preview_task.cancel()
+        self.preview_button.setText("Rendering...")
+        self.preview_task = self.render_scheduler.submit(RenderTask("preview", PREVIEW, render, gif_path=gif_path,
+                                                                    doing_gif=doing_gif))
+
+    def preview_render_finished(self, task):
+        if task is not self.preview_task or task.state == CANCELLED:
+            return
+        self.preview_task = None
+
+        if task.state == FAILED:
+            print(f"Failed to make preview for gif {task.details['gif_path']}.\n\tCaused by: {task.error}")
+            self.end_preview()
+            return
+
+        self.previewing = True
+        self.preview_player.load(task.result.audio)
+        self.preview_button.setText("End Preview")
+
+        if task.details["doing_gif"]:
+            self.set_movie(task.details["gif_path"], task.result.gif_data)
+            self.previewing_altered_gif = True
+        elif self.movie is not None:
+            self.movie.jumpToFrame(0)
+        else:
+            # No gif could be shown, so there's nothing for the sound to wait on
+            self.preview_player.play()
+
     def end_preview(self):
         self.previewing = False
+        if self.preview_task is not None:
+            task = self.preview_task
+            self.preview_task = None
+            task.cancel()
         if self.previewing_altered_gif:
             self.set_movie(self.gif_paths[self.preview_index])
             self.previewing_altered_gif = False
         if self.preview_button.isChecked():
             self.preview_button.setChecked(False)
         self.preview_button.setText("Preview")
-        self.sound.stop()
+        self.preview_player.stop()
+        if self.sound is not None:
+            self.sound.stop()
 
     def save(self):
         self.save_with_maybe_gif(False)
 
     def save_with_maybe_gif(self, do_gifs):
         if not self.recheck_eligibility():
-            return False
-
-        saved_any = False
+            return
 
         if len(self.gif_paths) == 1:
             audio_path = QFileDialog.getSaveFileName(self, caption="Save Soundifier Output", filter="Wav audio files (*.wav)")[0]
@@ -1115,24 +1391,91 @@ class MainWindow(QWidget):
                 self.settings.output_gif_path = QFileDialog.getSaveFileName(self,
                         caption="Save Speed-Altered Gif", filter="Gif images (*.gif)")[0]
 
-            saved_any = self.save_blip_track(self.gif_paths[0], audio_path)
+            self.save_blip_track(self.gif_paths[0], audio_path)
 
         else:
             output_folder = QFileDialog.getExistingDirectory(caption="Save Soundifier Output")
 
-            self.settings.output_gif_path = None
-
             if output_folder != "":
-                for save_for_gif in self.gif_paths:
-                    output_base_name = output_folder + "/" + save_for_gif.split("/")[-1][:-4]
-                    if do_gifs:
-                        self.settings.output_gif_path = output_base_name + ".gif"
-                    if self.save_blip_track(save_for_gif, output_base_name + ".wav"):
-                        saved_any = True
-
-        if saved_any:
+                # Running the same batch into the same folder again picks up where the last run left off, with the
+                # seed the last run used rather than this session's
+                journal = BatchJournal(get_journal_path(output_folder))
+                render_settings = self.settings.snapshot(stream_audio=True)
+                if journal.get_seed() is not None:
+                    render_settings.seed = journal.get_seed()
+                jobs = batch.make_batch_jobs(self.gif_paths, self.voice_files, render_settings, output_folder, do_gifs)
+                try:
+                    batch.check_output_paths(jobs)
+                except ValueError as e:
+                    self.batch_status_label.setText(f"Can't save: {e}")
+                    return
+                self.start_batch_save(jobs, journal)
+
+    def start_export(self, task):
+        self.export_task = self.render_scheduler.submit(task)
+        self.update_save_buttons()
+
+    def start_batch_save(self, jobs, journal):
+        try:
+            workers = int(self.batch_workers_field.text())
+        except ValueError:
+            workers = batch.DEFAULT_WORKERS
+
+        def render(task):
+            def on_result(result, done, total):
+                if not result.succeeded:
+                    print(f"Failed to save sound for gif {result.job.gif_path}.\n\tCaused by: {result.error}")
+                task.report_progress(done, total)
+
+            return batch.render_batch(jobs, workers, on_result=on_result, should_stop=task.is_cancelled, journal=journal)
+
+        self.batch_status_label.setText(f"Saving 0/{len(jobs)}...")
+        self.start_export(RenderTask("batch export", EXPORT, render, jobs=jobs))
+
+    def export_progressed(self, task):
+        if task is self.export_task and "jobs" in task.details:
+            done, total = task.progress
+            self.batch_status_label.setText(f"Saving {done}/{total}...")
+
+    def export_finished(self, task):
+        if task is not self.export_task:
+            return
+        self.export_task = None
+        self.update_save_buttons()
+
+        if "jobs" in task.details:
+            self.batch_save_finished(task)
+        elif task.state == FAILED:
+            print(f"Failed to save sound for gif {task.details['gif_path']}.\n\tCaused by: {task.error}")
+        elif task.state == SUCCEEDED:
+            self.nag()
+
+    def batch_save_finished(self, task):
+        if task.state == FAILED:
+            self.batch_status_label.setText(f"Saving failed: {task.error}")
+            return
+
+        results = task.result or []
+        failures = [result for result in results if not result.succeeded]
+
+        cached_count = sum(1 for result in results if result.from_cache or result.resumed)
+        cached_note = f" ({cached_count} reused from earlier renders)" if cached_count > 0 else ""
+        if len(failures) == 0:
+            self.batch_status_label.setText(f"Saved {len(results)} sounds{cached_note}.")
+        else:
+            failed_names = ", ".join(os.path.basename(result.job.gif_path) for result in failures)
+            self.batch_status_label.setText(f"Saved {len(results) - len(failures)}/{len(results)} sounds{cached_note}. Failed: {failed_names}")
+
+        if len(failures) != len(results):
             self.nag()
-        return saved_any
+
+    def closeEvent(self, event):
+        self.end_preview()
+        # Running exports stop at their next check without holding up the window, and nobody's listening anymore
+        self.render_scheduler.remove_listener(self.render_signals.relay)
+        self.render_scheduler.shutdown(wait=False)
+        self.preview_cache.shutdown()
+        super().closeEvent(event)
 
     def save_with_gif(self):
         self.save_with_maybe_gif(True)
@@ -1141,26 +1484,37 @@ class MainWindow(QWidget):
         self.settings.output_audio_path = output_path
         if self.settings.output_gif_path is not None:
             self.settings.output_gif_path = output_path[:-4] + ".gif"
-        if self.settings.output_audio_path != "":
-            try:
-                processor.make_and_save_blip_track(for_gif_path, self.settings, *self.voice_files)
-                return True
-            except Exception as e:
-                print(f"Failed to save sound for gif {for_gif_path}.\n\tCaused by: {e}")
-        return False
+        if self.settings.output_audio_path == "":
+            return
+
+        # The render goes on while the settings keep changing, so it gets its own copy of them. Like a batch, it's
+        # written while it's mixed, so a long gif never has to fit in memory whole.
+        render_settings = self.settings.snapshot(stream_audio=True)
+        voice_paths = self.voice_files.copy()
+
+        def render(task):
+            import processor
+            return processor.make_and_save_blip_track(for_gif_path, render_settings, *voice_paths,
+                                                      should_stop=task.is_cancelled)
+
+        self.start_export(RenderTask("export", EXPORT, render, gif_path=for_gif_path))
 
     def nag(self):
         self.nag_label.setText("*Thanks for using the Soundifier! If this tool has been helpful for you and you'd like to say thanks, please consider [__leaving a tip on my Ko-fi__](https://ko-fi.com/floralquafloral).*")
 
     def play_voice_sound(self):
-        self.sound.setSource(QUrl.fromLocalFile(random.choice(self.voice_files)))
+        if self.sound is None:
+            from PyQt6.QtMultimedia import QSoundEffect
+            self.sound = QSoundEffect()
+            self.sound.setVolume(1.0)
+        self.sound.setSource(QUrl.fromLocalFile(self.random.choice(self.voice_files)))
         self.sound.play()
 
     def select_gifs_with_dialog(self):
         return QFileDialog.getOpenFileNames(self, caption="Open File", filter="Gif images (*.gif)")[0]
 
     def apply_text_box_from(self, path, instant_preview=True):
-        selection = random.choice(os.listdir(path))
+        selection = self.random.choice(os.listdir(path))
         self.set_gif_paths([path + "/" + selection])
         try:
             set_dropdown_to = selection[:-4].replace("_", "/")
@@ -1170,8 +1524,9 @@ class MainWindow(QWidget):
                 if self.recheck_eligibility():
                     self.toggle_preview(True)
                     self.preview_button.setChecked(True)
-                    self.movie.jumpToFrame(0)
-                    self.movie_signal()
+                    if self.movie is not None:
+                        self.movie.jumpToFrame(0)
+                        self.movie_signal()
         except Exception as e:
             print(e)
 
@@ -1262,48 +1617,52 @@ def number_from_line(line):
         return int(line)
     return float(line)
 
-def populate_characters_dictionary(path, prefix="", universe="Basic"):
-    for character in os.listdir(path):
-        full_path = path + character
-        print(f"Checking out {full_path}")
-        if os.path.isfile(full_path) and full_path.endswith(".wav"):
-            CHARACTERS[prefix + character.replace(".wav", "")] = BasicCharacter([full_path], universe, get_default_settings(full_path))
-        elif os.path.isdir(full_path):
-            if os.path.isfile(full_path + "/.multi"):
-                print(f"Multiple characters in {character}, traversing...")
-                populate_characters_dictionary(full_path + "/", prefix=prefix + character + "/", universe=character)
-            else:
-                if os.path.isfile(full_path + "/.variant"):
-                    print(f"Character \"{character}\" has a variant!")
-                    voice_paths = []
-                    variant_paths = []
-                    variant_name = "Variant"
-
-                    for voice in os.listdir(full_path):
-                        if voice.endswith(".wav"):
-                            voice_clean_name = clean_name(voice)
-                            if voice_clean_name.lower() == character.lower() or voice_clean_name == "":
-                                voice_paths.append(full_path + "/" + voice)
-                            else:
-                                variant_name = voice_clean_name
-                                variant_paths.append(full_path + "/" + voice)
-
-                    if len(voice_paths) == 0:
-                        print(f"Character supposedly has a variant but no non-variant sounds: {character}")
-                        CHARACTERS[prefix + character] = BasicCharacter(variant_name, universe, get_default_settings(full_path))
-                    else:
-                        default_settings = get_default_settings(full_path)
-                        with open(full_path + "/.variant", "r") as file:
-                            variant_settings = get_settings_from_file(file, default_settings)
-                        CHARACTERS[prefix + character] = CharacterWithVariant(voice_paths, universe, default_settings, variant_name, variant_paths, variant_settings)
+def populate_characters_dictionary(path):
+    CHARACTERS.clear()
+    LOADED_CHARACTERS.clear()
+    for entry in character_index.get_character_entries(path, VERSION):
+        CHARACTERS[entry.name] = entry
+
+def get_character(name):
+    # Characters are only listed at startup, their voices and settings are read the first time they're picked
+    if name not in LOADED_CHARACTERS:
+        LOADED_CHARACTERS[name] = load_character(CHARACTERS[name], get_voices_directory())
+    return LOADED_CHARACTERS[name]
+
+def load_character(entry: character_index.CharacterEntry, root):
+    full_path = root + entry.path
+    if entry.kind == character_index.SINGLE_VOICE:
+        return BasicCharacter([full_path], entry.universe, get_default_settings(full_path))
+
+    character = os.path.basename(entry.path)
+    if entry.kind == character_index.VARIANT_FOLDER:
+        voice_paths = []
+        variant_paths = []
+        variant_name = "Variant"
+
+        for voice in os.listdir(full_path):
+            if voice.endswith(".wav"):
+                voice_clean_name = clean_name(voice)
+                if voice_clean_name.lower() == character.lower() or voice_clean_name == "":
+                    voice_paths.append(full_path + "/" + voice)
                 else:
-                    voice_paths = []
-                    for voice in os.listdir(full_path):
-                        if voice.endswith(".wav"):
-                            voice_paths.append(full_path + "/" + voice)
-                    CHARACTERS[prefix + character] = BasicCharacter(voice_paths, universe, get_default_settings(full_path))
-        else:
-            print(f"Something went wrong! Nothing at {full_path}!")
+                    variant_name = voice_clean_name
+                    variant_paths.append(full_path + "/" + voice)
+
+        if len(voice_paths) == 0:
+            print(f"Character supposedly has a variant but no non-variant sounds: {character}")
+            return BasicCharacter(variant_paths, entry.universe, get_default_settings(full_path))
+
+        default_settings = get_default_settings(full_path)
+        with open(full_path + "/.variant", "r") as file:
+            variant_settings = get_settings_from_file(file, default_settings)
+        return CharacterWithVariant(voice_paths, entry.universe, default_settings, variant_name, variant_paths, variant_settings)
+
+    voice_paths = []
+    for voice in os.listdir(full_path):
+        if voice.endswith(".wav"):
+            voice_paths.append(full_path + "/" + voice)
+    return BasicCharacter(voice_paths, entry.universe, get_default_settings(full_path))
 
 def add_characters_from_universe(dropdown, universe):
     for name in CHARACTERS:
@@ -1336,9 +1695,14 @@ def make_punctuation_skip_availability_excuse(excuse):
     return f"<br><em>Sorry, Punctuation Skipping does not work {excuse} <strong>;-;</strong></em>"
 
 if __name__ == '__main__':
+    # the batch saver's worker processes start by re-running the frozen executable
+    multiprocessing.freeze_support()
+
     # create the QApplication
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(resource_path("soundifier.ico")))
+    configure_logging()
+    startup_timing.mark("application created")
 
     # create the main window
     window = MainWindow()
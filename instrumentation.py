@@ -0,0 +1,167 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+# Everything the renderer has to say goes through this logger instead of print, with an event name and fields
+# attached so the JSON formatter can write them out for other tools to read
+LOGGER = logging.getLogger("soundifier")
+
+STAGE = "stage"
+COUNT = "count"
+
+Listener = Callable[[dict], None]
+
+
+class Recorder:
+    # Collects how long every stage of a render took and how much work it did. Listeners hear about each stage and
+    # count as it happens, and the whole thing can be saved as a trace for chrome://tracing or Perfetto.
+    def __init__(self):
+        self.events: list[dict] = []
+        self.counters: dict[str, int] = {}
+        self.listeners: list[Listener] = []
+        self.lock = threading.Lock()
+
+    def add_listener(self, listener: Listener) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        self.listeners.remove(listener)
+
+    def emit(self, event: dict) -> None:
+        with self.lock:
+            self.events.append(event)
+            if event["type"] == COUNT:
+                self.counters[event["name"]] = self.counters.get(event["name"], 0) + event["amount"]
+        for listener in self.listeners:
+            listener(event)
+
+    def add_stage(self, name: str, start: float, seconds: float, details: dict[str, Any]) -> None:
+        self.emit({"type": STAGE, "name": name, "start": start, "seconds": seconds, "process": os.getpid(),
+                   "thread": threading.get_ident(), "details": details})
+
+    def add_count(self, name: str, amount: int) -> None:
+        self.emit({"type": COUNT, "name": name, "amount": amount, "time": time.time(), "process": os.getpid()})
+
+    def merge(self, events: list[dict]) -> None:
+        # For events recorded somewhere else, like a batch worker process
+        for event in events:
+            self.emit(event)
+
+    def get_summary(self) -> dict:
+        return summarize_events(self.events)
+
+    def get_trace(self) -> dict:
+        with self.lock:
+            events = list(self.events)
+
+        trace_events = []
+        totals: dict[tuple[int, str], int] = {}
+        for event in events:
+            if event["type"] == STAGE:
+                trace_events.append({
+                    "name": event["name"], "ph": "X", "pid": event["process"], "tid": event["thread"],
+                    "ts": event["start"] * 1e6, "dur": event["seconds"] * 1e6, "args": event["details"]
+                })
+            else:
+                total_key = (event["process"], event["name"])
+                totals[total_key] = totals.get(total_key, 0) + event["amount"]
+                trace_events.append({
+                    "name": event["name"], "ph": "C", "pid": event["process"], "ts": event["time"] * 1e6,
+                    "args": {event["name"]: totals[total_key]}
+                })
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.get_trace(), file)
+
+
+def summarize_events(events: list[dict]) -> dict:
+    stages: dict[str, float] = {}
+    counters: dict[str, int] = {}
+    for event in events:
+        if event["type"] == STAGE:
+            stages[event["name"]] = stages.get(event["name"], 0.0) + event["seconds"]
+        else:
+            counters[event["name"]] = counters.get(event["name"], 0) + event["amount"]
+    return {
+        "stages": {name: round(seconds, 5) for name, seconds in stages.items()},
+        "counters": counters
+    }
+
+
+CURRENT_RECORDER: contextvars.ContextVar[Optional[Recorder]] = contextvars.ContextVar("recorder", default=None)
+
+
+@contextlib.contextmanager
+def recording(recorder: Optional[Recorder]) -> Iterator[Optional[Recorder]]:
+    # Stages and counts inside this go to the recorder. Without one they cost next to nothing.
+    if recorder is None:
+        yield None
+        return
+
+    token = CURRENT_RECORDER.set(recorder)
+    try:
+        yield recorder
+    finally:
+        CURRENT_RECORDER.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str, **details: Any) -> Iterator[None]:
+    recorder = CURRENT_RECORDER.get()
+    if recorder is None:
+        yield
+        return
+
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_stage(name, start, time.perf_counter() - started, details)
+
+
+def count(name: str, amount: int = 1) -> None:
+    recorder = CURRENT_RECORDER.get()
+    if recorder is not None:
+        recorder.add_count(name, amount)
+
+
+def log_event(event: str, message: str, level: int = logging.INFO, **fields: Any) -> None:
+    LOGGER.log(level, message, extra={"event": event, "fields": fields})
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": record.created,
+            "level": record.levelname.lower(),
+            "event": getattr(record, "event", None),
+            "message": record.getMessage(),
+            **getattr(record, "fields", {})
+        }
+        return json.dumps(entry)
+
+
+# Whether configure_logging last set up JSON output, or None if it was never called. Worker processes are configured
+# the same way as the process that started them.
+JSON_LOGGING: Optional[bool] = None
+
+
+def configure_logging(json_output: bool = False) -> None:
+    global JSON_LOGGING
+    JSON_LOGGING = json_output
+    stream = sys.stdout if sys.stdout is not None else sys.stderr
+    # Windowed builds have neither
+    handler = logging.StreamHandler(stream) if stream is not None else logging.NullHandler()
+    handler.setFormatter(JsonLogFormatter() if json_output else logging.Formatter("%(message)s"))
+    LOGGER.handlers = [handler]
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.propagate = False
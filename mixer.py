@@ -0,0 +1,267 @@
+import functools
+import os
+import wave
+from typing import Optional
+
+import numpy
+from pydub import AudioSegment
+
+try:
+    import audioop
+except ImportError:
+    import pyaudioop as audioop
+
+SAMPLE_TYPES = {
+    1: numpy.int8,
+    2: numpy.int16,
+    4: numpy.int32
+}
+
+# What the mix adds up in. Every insert is clipped to the sample range right away, so adding one more blip on top
+# can't go past twice that, which 32 bits hold for 8 and 16-bit samples
+MIX_TYPES = {
+    1: numpy.int32,
+    2: numpy.int32,
+    4: numpy.int64
+}
+
+STREAM_CHUNK_FRAMES = 65536
+
+# Where fade_out() takes the volume down to: -120 dB, worked out the same way pydub does
+FADED_OUT_GAIN = 10 ** (float(-120) / 20)
+
+
+def get_resampled_frame_count(frames: int, from_rate: int, to_rate: int) -> int:
+    if from_rate == to_rate:
+        return frames
+
+    # Resampling silence a chunk at a time comes out the same length as resampling all of it at once
+    state = None
+    total = 0
+    silence = b"\0\0" * STREAM_CHUNK_FRAMES
+    while frames > 0:
+        taking = min(frames, STREAM_CHUNK_FRAMES)
+        converted, state = audioop.ratecv(silence[:taking * 2], 2, 1, from_rate, to_rate, state)
+        total += len(converted) // 2
+        frames -= taking
+    return total
+
+
+@functools.lru_cache(maxsize=64)
+def get_fade_ramp(fade_frames: float) -> numpy.ndarray:
+    # The volume of each frame of fade_out(), which steps down once per frame. fade_frames is the length pydub works
+    # out from the fade duration and the sample rate, which can differ in its last bit depending on where the fade
+    # starts, so that's what the ramps are kept by.
+    scale_step = (FADED_OUT_GAIN - 1.0) / fade_frames
+    ramp = 1.0 + scale_step * numpy.arange(int(fade_frames), dtype=numpy.float64)
+    ramp.flags.writeable = False
+    return ramp
+
+
+class BlipMixer:
+    # Mixes every blip into one sample buffer instead of rebuilding the whole track with AudioSegment.overlay per blip.
+    def __init__(self, duration: float, voices: list[AudioSegment]):
+        self.duration = duration
+
+        # overlay() syncs the track to the widest format of it and the voice, and the track starts as pydub's default
+        # 11025 Hz mono 16-bit silence.
+        # This isn't exactly what overlay() does for voices in different formats though: the mix is in the widest
+        # format of all of them from the start, where pydub resamples the track it has so far whenever a wider voice
+        # first shows up. Voice sets with more than one frame rate are not sample-identical to overlay() because of
+        # that, and converting the voices to one format beforehand (see voice_cache.get_voice_format) doesn't change
+        # it, since the resampling of the track itself is what differs.
+        self.channels = max([1] + [voice.channels for voice in voices])
+        self.frame_rate = max([11025] + [voice.frame_rate for voice in voices])
+        self.sample_width = max([2] + [voice.sample_width for voice in voices])
+
+        self.frame_count = get_resampled_frame_count(int(11025 * (duration / 1000.0)), 11025, self.frame_rate)
+        self.blips_added = 0
+
+        # The buffer holds the frames from window_start onwards. Only the streaming mixer ever moves the window.
+        self.window_start = 0
+        self.buffer = numpy.zeros(self.get_initial_capacity() * self.channels, dtype=MIX_TYPES[self.sample_width])
+
+    def get_initial_capacity(self) -> int:
+        return self.frame_count + self.frame_rate
+
+    def length_in_ms(self) -> int:
+        return round(1000 * (self.frame_count / self.frame_rate))
+
+    def ensure_capacity(self, frames: int) -> None:
+        needed = (frames - self.window_start) * self.channels
+        if needed > len(self.buffer):
+            grown = numpy.zeros(max(needed, len(self.buffer) * 2), dtype=self.buffer.dtype)
+            grown[:len(self.buffer)] = self.buffer
+            self.buffer = grown
+
+    def match_format(self, voice: AudioSegment) -> AudioSegment:
+        return voice.set_channels(self.channels).set_frame_rate(self.frame_rate).set_sample_width(self.sample_width)
+
+    def advance_to(self, frame: int) -> None:
+        pass
+
+    def cut_and_fade(self, voice: AudioSegment, duration: float, fade_duration: int) -> Optional[numpy.ndarray]:
+        # The samples of AudioSegment.silent(duration).overlay(voice).fade_out(fade_duration), worked out straight from
+        # the voice's samples: the overlay cuts the voice off where the silence ends, and the fade scales the frames
+        # at the end of it. Returns None when pydub would have to convert the voice first, or when the fade isn't
+        # the simple kind, and then the caller has to go through pydub after all.
+        if (voice.channels, voice.frame_rate, voice.sample_width) != (self.channels, self.frame_rate, self.sample_width):
+            return None
+        if voice.frame_rate < 11025 or voice.sample_width < 2 or fade_duration > 100:
+            return None
+
+        frame_rate = voice.frame_rate
+        samples = numpy.frombuffer(voice.raw_data, dtype=SAMPLE_TYPES[self.sample_width]).reshape(-1, self.channels)
+
+        # The silence is made at 11025 Hz and resampled, then overlay() cuts it to its rounded millisecond length
+        silence_frames = get_resampled_frame_count(int(11025 * (duration / 1000.0)), 11025, frame_rate)
+        overlaid_frames = int(round(1000 * (silence_frames / frame_rate)) * (frame_rate / 1000.0))
+        if fade_duration <= 0:
+            return samples[:overlaid_frames].ravel()
+
+        length = round(1000 * (overlaid_frames / frame_rate))
+        fade_start = length - fade_duration
+        kept_frames = int(fade_start * (frame_rate / 1000.0))
+        if fade_start < 0 or kept_frames > overlaid_frames:
+            return None
+        if len(samples) <= kept_frames:
+            # The voice is over before the fade starts
+            return samples.ravel()
+
+        start_frame = fade_start * (frame_rate / 1000.0)
+        fade_frames = length * (frame_rate / 1000.0) - start_frame
+        ramp = get_fade_ramp(fade_frames)
+        # Frames past the end of the overlaid segment aren't in the output at all, and ones past the end of the voice
+        # are silence
+        fading = (start_frame + numpy.arange(len(ramp), dtype=numpy.float64)).astype(numpy.int64)
+        fading = fading[fading < overlaid_frames]
+        faded = numpy.zeros((len(fading), self.channels), dtype=samples.dtype)
+        audible = fading < len(samples)
+        faded[audible] = numpy.floor(samples[fading[audible]] * ramp[:len(fading)][audible, None])
+
+        return numpy.concatenate((samples[:kept_frames], faded)).ravel()
+
+    def add(self, voice: AudioSegment, position: float) -> None:
+        voice = self.match_format(voice)
+        self.add_samples(numpy.frombuffer(voice.raw_data, dtype=SAMPLE_TYPES[self.sample_width]), position)
+
+    def add_samples(self, samples: numpy.ndarray, position: float) -> None:
+        # The samples have to be in the mix's own format already.
+        # Same slicing arithmetic as AudioSegment.overlay: the track is cut at the position and re-joined up to its own
+        # rounded millisecond length, so it can gain or lose a frame or two at the end on every insert.
+        length = self.length_in_ms()
+        start = int(min(position, length) * (self.frame_rate / 1000.0))
+        end = int(length * (self.frame_rate / 1000.0))
+        new_frame_count = max(start, end)
+
+        self.advance_to(start)
+
+        samples = samples[:(new_frame_count - start) * self.channels]
+        # Adding trailing silence changes nothing, and overlap prevention pads every blip with plenty of it
+        audible = numpy.flatnonzero(samples)
+        samples = samples[:audible[-1] + 1] if len(audible) > 0 else samples[:0]
+
+        self.ensure_capacity(start + len(samples) // self.channels)
+        if new_frame_count < self.frame_count:
+            self.buffer[(new_frame_count - self.window_start) * self.channels:(self.frame_count - self.window_start) * self.channels] = 0
+        self.frame_count = new_frame_count
+
+        offset = (start - self.window_start) * self.channels
+        region = self.buffer[offset:offset + len(samples)]
+        region += samples
+        # overlay() saturates after every insert rather than once at the end, and blips that overlap loudly enough to
+        # clip would come out differently if we didn't do the same. This only touches the blip's own samples.
+        limits = numpy.iinfo(SAMPLE_TYPES[self.sample_width])
+        numpy.clip(region, limits.min, limits.max, out=region)
+        self.blips_added += 1
+
+    def get_raw_data(self) -> bytes:
+        self.ensure_capacity(self.frame_count)
+        return self.buffer[:self.frame_count * self.channels].astype(SAMPLE_TYPES[self.sample_width]).tobytes()
+
+    def to_audio_segment(self) -> AudioSegment:
+        if self.blips_added == 0:
+            return AudioSegment.silent(duration=self.duration)
+
+        return AudioSegment(
+            data=self.get_raw_data(),
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
+
+    def export_wav(self, path: str) -> None:
+        if self.blips_added == 0:
+            self.to_audio_segment().export(path, format="wav")
+            return
+
+        with wave.open(path, "wb") as file:
+            file.setnchannels(self.channels)
+            file.setsampwidth(self.sample_width)
+            file.setframerate(self.frame_rate)
+            file.setnframes(self.frame_count)
+            # Converted a chunk at a time, so there's never a second copy of the whole mix
+            self.ensure_capacity(self.frame_count)
+            chunk_samples = STREAM_CHUNK_FRAMES * self.channels
+            for start in range(0, self.frame_count * self.channels, chunk_samples):
+                end = min(start + chunk_samples, self.frame_count * self.channels)
+                file.writeframesraw(self.buffer[start:end].astype(SAMPLE_TYPES[self.sample_width]).tobytes())
+
+
+class StreamingBlipMixer(BlipMixer):
+    # Writes the wav while mixing, only holding the frames that blips can still land on. Blips have to be added in
+    # order of position, which make_blip_mix always does. The wav is written next to path and only moved there by
+    # finish, so a mix that fails or gets cancelled never leaves a cut off file behind, as long as discard is called.
+    def __init__(self, duration: float, voices: list[AudioSegment], path: str, chunk_frames: int = STREAM_CHUNK_FRAMES):
+        self.path = path
+        self.temporary_path = path + ".tmp"
+        self.chunk_frames = chunk_frames
+        self.file: Optional[wave.Wave_write] = None
+        super().__init__(duration, voices)
+
+    def get_initial_capacity(self) -> int:
+        return self.chunk_frames * 2 + self.frame_rate
+
+    def write_frames(self, frames: int) -> None:
+        if self.file is None:
+            self.file = wave.open(self.temporary_path, "wb")
+            self.file.setnchannels(self.channels)
+            self.file.setsampwidth(self.sample_width)
+            self.file.setframerate(self.frame_rate)
+
+        samples = frames * self.channels
+        self.file.writeframesraw(self.buffer[:samples].astype(SAMPLE_TYPES[self.sample_width]).tobytes())
+
+        remaining = len(self.buffer) - samples
+        self.buffer[:remaining] = self.buffer[samples:]
+        self.buffer[remaining:] = 0
+        self.window_start += frames
+
+    def advance_to(self, frame: int) -> None:
+        # Nothing can be added before the newest blip anymore, so every whole chunk before it is final
+        while frame - self.window_start >= self.chunk_frames:
+            self.write_frames(self.chunk_frames)
+
+    def finish(self) -> None:
+        if self.blips_added == 0:
+            AudioSegment.silent(duration=self.duration).export(self.temporary_path, format="wav")
+        else:
+            while self.window_start < self.frame_count:
+                self.write_frames(min(self.chunk_frames, self.frame_count - self.window_start))
+            self.file.close()
+            self.file = None
+        os.replace(self.temporary_path, self.path)
+
+    def discard(self) -> None:
+        # Closes and removes whatever was written so far. Does nothing once finish is done.
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.temporary_path):
+            os.remove(self.temporary_path)
+
+    def to_audio_segment(self) -> AudioSegment:
+        raise RuntimeError("A streaming mix is written straight to its wav file")
+
+    def export_wav(self, path: str) -> None:
+        raise RuntimeError("A streaming mix is written straight to its wav file")
@@ -0,0 +1,51 @@
+from pydub import AudioSegment
+
+import instrumentation
+
+from stage_cache import SizedCache
+from voice_cache import VoiceSample
+
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+VARIANTS = SizedCache(CACHE_MAX_BYTES, lambda variant: len(variant.raw_data))
+
+
+def pitch_voice(voice: AudioSegment, pitch: float) -> AudioSegment:
+    instrumentation.count("resamples")
+    new_sample_rate = int(voice.frame_rate * pitch)
+    return voice._spawn(voice.raw_data, overrides={"frame_rate": new_sample_rate}).set_frame_rate(voice.frame_rate)
+
+
+def get_pitch_steps(min_pitch: float, max_pitch: float, steps: int) -> list[float]:
+    if steps <= 1 or min_pitch == max_pitch:
+        return [(min_pitch + max_pitch) / 2]
+    return [min_pitch + (max_pitch - min_pitch) * step / (steps - 1) for step in range(steps)]
+
+
+def get_variant(sample: VoiceSample, voice: AudioSegment, pitch: float) -> AudioSegment:
+    # Pitches that land on the same sample rate make the same variant, so that's what the cache goes by
+    key = (sample.path, sample.mtime, sample.get_format(), int(sample.frame_rate * pitch))
+    variant = VARIANTS.get(key)
+    if variant is None:
+        variant = pitch_voice(voice, pitch)
+        VARIANTS.put(key, variant)
+    return variant
+
+
+class PitchBank:
+    def __init__(self, samples: list[VoiceSample], voices: list[AudioSegment], min_pitch: float, max_pitch: float, steps: int):
+        self.min_pitch = min_pitch
+        self.max_pitch = max_pitch
+        self.steps = get_pitch_steps(min_pitch, max_pitch, steps)
+        self.variants = [
+            [get_variant(sample, voice, step) for step in self.steps]
+            for sample, voice in zip(samples, voices)
+        ]
+
+    def get(self, voice_index: int, pitch: float) -> AudioSegment:
+        variants = self.variants[voice_index]
+        if len(variants) == 1:
+            return variants[0]
+
+        step_index = round((pitch - self.min_pitch) / (self.max_pitch - self.min_pitch) * (len(variants) - 1))
+        return variants[min(max(step_index, 0), len(variants) - 1)]
@@ -0,0 +1,121 @@
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt6.QtGui import QMovie
+
+from stage_cache import SizedCache, get_file_identity
+
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+MAX_MOVIES = 8
+
+GIF_SIGNATURES = (b"GIF87a", b"GIF89a")
+# The signature and then the logical screen width and height, as little-endian 16-bit numbers
+GIF_HEADER_SIZE = 10
+
+
+def get_gif_size(header: bytes) -> Optional[tuple[int, int]]:
+    if len(header) < GIF_HEADER_SIZE or header[:6] not in GIF_SIGNATURES:
+        return None
+    width, height = struct.unpack("<HH", header[6:GIF_HEADER_SIZE])
+    if width == 0 or height == 0:
+        return None
+    return width, height
+
+
+def read_gif_size(path: str) -> Optional[tuple[int, int]]:
+    # Only the header is read, nothing gets decoded
+    try:
+        with open(path, "rb") as file:
+            return get_gif_size(file.read(GIF_HEADER_SIZE))
+    except OSError:
+        return None
+
+
+def make_movie(data: bytes | QByteArray) -> QMovie:
+    buffer = QBuffer()
+    # A QByteArray is shared with the buffer rather than copied, as long as nothing writes to it
+    buffer.setData(data if isinstance(data, QByteArray) else QByteArray(data))
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    movie = QMovie(buffer, QByteArray(b"gif"))
+    # The movie reads from the buffer as it plays, so the buffer has to live exactly as long as the movie
+    buffer.setParent(movie)
+    return movie
+
+
+class PreviewCache:
+    # Keeps the gifs of a batch close at hand while paging through it. File contents are read ahead in the background
+    # for the gifs next to the one being shown, and the last few movies are kept as they are, so going back and forth
+    # doesn't read anything from disk again. Movies can only be made on the GUI thread, so only the reading is
+    # done ahead of time. A movie plays from the same data the file cache holds, so max_bytes covers both, and a
+    # movie is let go of once its data is evicted.
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, max_movies: int = MAX_MOVIES):
+        self.max_movies = max_movies
+        self.files = SizedCache(max_bytes, QByteArray.size)
+        self.movies: OrderedDict[tuple, tuple[QMovie, Optional[tuple[int, int]]]] = OrderedDict()
+        self.prefetching: set[tuple] = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gif-prefetch")
+
+    def get_data(self, path: str, identity: tuple) -> QByteArray:
+        data = self.files.get(identity)
+        if data is None:
+            data = self.read(path, identity)
+        return data
+
+    def read(self, path: str, identity: tuple) -> QByteArray:
+        with open(path, "rb") as file:
+            data = QByteArray(file.read())
+        self.files.put(identity, data)
+        return data
+
+    def get_movie(self, path: str) -> Optional[tuple[QMovie, Optional[tuple[int, int]]]]:
+        # Returns the movie and the gif's size, or None if the gif can't be read anymore, like when it was deleted
+        # since the batch was picked. Movies are handed out again as they are, so whoever shows one should stop it
+        # once it's not shown anymore.
+        for cached_identity in [cached_identity for cached_identity in self.movies if cached_identity not in self.files]:
+            del self.movies[cached_identity]
+
+        try:
+            identity = get_file_identity(path)
+            cached = self.movies.get(identity)
+            if cached is not None:
+                self.movies.move_to_end(identity)
+                return cached
+
+            data = self.get_data(path, identity)
+        except OSError:
+            return None
+
+        cached = (make_movie(data), get_gif_size(data.left(GIF_HEADER_SIZE).data()))
+        self.movies[identity] = cached
+        while len(self.movies) > self.max_movies:
+            self.movies.popitem(last=False)
+        return cached
+
+    def prefetch(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            try:
+                identity = get_file_identity(path)
+            except OSError:
+                continue
+            with self.lock:
+                if identity in self.files or identity in self.prefetching:
+                    continue
+                self.prefetching.add(identity)
+            self.executor.submit(self.load, path, identity)
+
+    def load(self, path: str, identity: tuple) -> None:
+        try:
+            self.read(path, identity)
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self.prefetching.discard(identity)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,145 +1,279 @@
+import functools
+import io
 import os
 import random
 import sys
-from typing import Optional
+from typing import Callable, NamedTuple, Optional
 
-from PIL.Image import Image
-from PIL.ImageFile import ImageFile
+import numpy
+from PIL import Image
 from pydub import AudioSegment
-from PIL import Image, ImageSequence
 
+import frame_cache
+import instrumentation
+import render_cache
+import voice_cache
+from frame_analysis import FrameTimeline, analyze_gif_frames
+from gif_retimer import write_retimed_gif, write_retimed_gif_to
+from mixer import BlipMixer, StreamingBlipMixer
+from pitch_bank import PitchBank, pitch_voice
 from settings import SoundifierSettings
+from stage_cache import StageCache, get_file_identity, get_settings_key, get_written_file_state
 
 
-def get_blip_timings_from_gif(gif_path: str, settings: SoundifierSettings) -> list[int]:
-    gif: ImageFile = Image.open(gif_path)
+TIMING_SETTINGS = ("speed", "interval", "making_for_preview", "easy_align", "cutoff_distance")
+RETIMED_GIF_SETTINGS = ("speed", "interval", "mettatonize")
+PLAN_SETTINGS = ("skip_first_blip", "skip_punctuation", "skip_non_alphanumeric", "skip_characters", "full_text",
+                 "min_pitch", "max_pitch", "random_pitch_chance", "seed")
+MIX_SETTINGS = ("min_pitch", "max_pitch", "pitch_steps", "do_overlap_prevention", "olp_hard_cutoff_leniency",
+                "olp_fade_duration", "output_frame_rate", "output_channels", "output_sample_width")
 
-    prev_frame: Optional[Image] = None
+# Every render stage remembers its latest results by everything it reads, so changing a setting only redoes the
+# stages that depend on it. Mixes hold whole tracks, so only the last couple are kept.
+TIMELINES = StageCache(16)
+BLIP_TIMINGS = StageCache(32)
+RETIMED_GIFS = StageCache(16)
+RETIMED_GIF_DATA = StageCache(4)
+BLIP_PLANS = StageCache(16)
+MIXES = StageCache(2)
+SAVED_TRACKS = StageCache(16)
 
-    frame_count = 0
-    last_changing_frame = 0
-    consecutive_identical_frames = 0
 
-    frames_before_pauses = []
-    frames_after_pauses = []
+class PlannedBlip(NamedTuple):
+    timing_index: int
+    voice_index: int
+    # None plays the voice at its own pitch
+    pitch: Optional[float]
 
-    for frame in ImageSequence.Iterator(gif):
-        frame_count += 1
-        if prev_frame is None or frame.tobytes() != prev_frame.tobytes():
-            last_changing_frame = frame_count
-            if consecutive_identical_frames >= 2:
-                frames_after_pauses.append(frame_count)
-            consecutive_identical_frames = 0
-        else:
-            consecutive_identical_frames += 1
-            if consecutive_identical_frames == 2:
-                frames_before_pauses.append(frame_count - 2)
-
-        prev_frame = frame.copy()
 
-    moment = 0
-    moment_offset = 0
-    if settings.making_for_preview:
-        moment_offset = -30 / settings.speed
-    elif settings.easy_align:
-        moment_offset = -45 / settings.speed
-    letter_changes = 0
-    timings = []
+class MixSource(NamedTuple):
+    # None when the render isn't seeded, since then it can't be reused
+    key: Optional[tuple]
+    samples: list[voice_cache.VoiceSample]
+    audios: list[AudioSegment]
+    blip_timings: list[int]
+    plan: list[PlannedBlip]
 
-    frame_number = 0
-    metta_letters = 0
-    accumulated_frame_duration = 0
-    frames = []
-    durations = []
 
-    silence_after_moment = -1
+class PreviewRender(NamedTuple):
+    audio: AudioSegment
+    # The speed-altered gif, if one was asked for
+    gif_data: Optional[bytes]
 
-    for frame in ImageSequence.Iterator(gif):
-        moment += frame.info['duration']
-        frame_number += 1
 
-        frame_natural_duration = frame.info['duration']
-        accumulated_frame_duration += frame_natural_duration / settings.speed
+class RenderCancelled(Exception):
+    pass
 
-        frame_changed = prev_frame is None or frame.tobytes() != prev_frame.tobytes()
 
-        if frame_number in frames_after_pauses:
-            letter_changes = 0
+def check_cancelled(should_stop: Optional[Callable[[], bool]]) -> None:
+    if should_stop is not None and should_stop():
+        raise RenderCancelled()
 
-        about_to_pause = frame_number in frames_before_pauses
 
-        if frame_changed:
-            letter_changes += 1
+def find_blip_timings(timeline: FrameTimeline, settings: SoundifierSettings) -> list[float]:
+    moment_offset = 0
+    if settings.making_for_preview:
+        moment_offset = -30 / settings.speed
+    elif settings.easy_align:
+        moment_offset = -45 / settings.speed
 
-            metta_letters += 1
-            consecutive_identical_frames = 0
+    # Letters are counted from the last pause, which resets the count on the letter right after it
+    letters_so_far = numpy.cumsum(timeline.letter_changed)
+    letters_before = letters_so_far - timeline.letter_changed
+    frame_numbers = numpy.arange(len(timeline))
+    counting_from = numpy.maximum.accumulate(numpy.where(timeline.pause_after, frame_numbers, 0))
+    letter_changes = letters_so_far - letters_before[counting_from]
+
+    offsetted_moments = timeline.moments / settings.speed + moment_offset
+    blips = timeline.letter_changed & ((letter_changes % settings.interval == 0) | timeline.pause_before)
+    timings = offsetted_moments[blips & (offsetted_moments > 0)]
+
+    if settings.cutoff_distance > 0:
+        # Everything after the first gap that's long enough goes silent, except blips at the very same moment
+        gaps = numpy.flatnonzero(numpy.diff(timings) >= settings.cutoff_distance / settings.speed)
+        if len(gaps) > 0:
+            silence_after = gaps[0] + 1
+            rest = timings[silence_after + 1:]
+            timings = numpy.concatenate((timings[:silence_after], rest[rest <= timings[silence_after]]))
+
+    return timings.tolist()
+
+
+def find_frame_durations(timeline: FrameTimeline, settings: SoundifierSettings) -> list[Optional[float]]:
+    # How long each frame lasts in the speed-altered gif, or None for frames that Mettatonize leaves out
+    durations = timeline.durations / settings.speed
+    if not settings.mettatonize or settings.interval == 1:
+        return durations.tolist()
+
+    # Mettatonize counts frames since the third identical frame in a row. The identical frames at the very start
+    # carry on from the ones at the end of the gif.
+    frame_numbers = numpy.arange(len(timeline))
+    last_letter = numpy.maximum.accumulate(numpy.where(timeline.letter_changed, frame_numbers, -1))
+    identical_before = frame_numbers - last_letter - 1 + numpy.where(last_letter < 0, timeline.trailing_identical_frames, 0)
+    restarts = ~timeline.letter_changed & (identical_before >= 2)
+    metta_letters = frame_numbers - numpy.maximum.accumulate(numpy.where(restarts, frame_numbers, -1))
+
+    skipped = (metta_letters % settings.interval != 0) & (frame_numbers < timeline.last_changing_frame) & ~timeline.pause_before
+
+    # Skipped frames' time goes to the next frame that's kept
+    kept = ~skipped
+    kept_durations = numpy.bincount(numpy.cumsum(kept) - kept, weights=timeline.durations, minlength=int(kept.sum()))
+    frame_durations: list[Optional[float]] = [None] * len(timeline)
+    for frame_number, duration in zip(numpy.flatnonzero(kept).tolist(), (kept_durations / settings.speed).tolist()):
+        frame_durations[frame_number] = duration
+    return frame_durations
+
+
+def decoded_frame(should_stop: Optional[Callable[[], bool]]) -> None:
+    instrumentation.count("frames_decoded")
+    check_cancelled(should_stop)
+
+
+def get_frame_timeline(gif_path: str, should_stop: Optional[Callable[[], bool]] = None) -> FrameTimeline:
+    key = get_file_identity(gif_path)
+    timeline = TIMELINES.get(key)
+    if timeline is None:
+        records = frame_cache.load_frame_records(gif_path)
+        if records is None:
+            with instrumentation.stage("analyze_gif", gif=gif_path), Image.open(gif_path) as gif:
+                records = analyze_gif_frames(gif, on_frame=lambda: decoded_frame(should_stop))
+            frame_cache.store_frame_records(gif_path, records)
+
+        timeline = FrameTimeline(records)
+        TIMELINES.put(key, timeline)
+    return timeline
+
+
+def get_blip_timings_key(gif_path: str, settings: SoundifierSettings) -> tuple:
+    return get_file_identity(gif_path), get_settings_key(settings, TIMING_SETTINGS)
+
+
+def get_blip_timings_from_gif(gif_path: str, settings: SoundifierSettings,
+                              should_stop: Optional[Callable[[], bool]] = None) -> list[int]:
+    key = get_blip_timings_key(gif_path, settings)
+    timings = BLIP_TIMINGS.get(key)
+    if timings is None:
+        timeline = get_frame_timeline(gif_path, should_stop)
+        with instrumentation.stage("find_blip_timings"):
+            timings = tuple(find_blip_timings(timeline, settings))
+        BLIP_TIMINGS.put(key, timings)
 
-            if letter_changes % settings.interval == 0 or about_to_pause:
-                offsetted_moment = moment / settings.speed + moment_offset
-                if offsetted_moment > 0:
-                    should_append = True
+    if settings.output_gif_path is not None:
+        save_speed_altered_gif(gif_path, settings, should_stop)
+
+    return list(timings)
+
+
+def save_speed_altered_gif(gif_path: str, settings: SoundifierSettings,
+                           should_stop: Optional[Callable[[], bool]] = None) -> None:
+    key = (get_file_identity(gif_path), get_settings_key(settings, RETIMED_GIF_SETTINGS), settings.output_gif_path)
+    written = RETIMED_GIFS.get(key)
+    if written is not None and written == get_written_file_state(settings.output_gif_path):
+        return
+
+    durations = find_frame_durations(get_frame_timeline(gif_path, should_stop), settings)
+    with instrumentation.stage("write_gif", path=settings.output_gif_path):
+        write_retimed_gif(gif_path, settings.output_gif_path, durations, lambda: check_cancelled(should_stop))
+    written = get_written_file_state(settings.output_gif_path)
+    RETIMED_GIFS.put(key, written)
+    instrumentation.count("bytes_written", written[1] if written is not None else 0)
+    instrumentation.log_event("gif_saved", f"Successfully saved speed-altered gif as {settings.output_gif_path}",
+                              path=settings.output_gif_path)
+
+
+def get_speed_altered_gif_data(gif_path: str, settings: SoundifierSettings,
+                               should_stop: Optional[Callable[[], bool]] = None) -> bytes:
+    key = (get_file_identity(gif_path), get_settings_key(settings, RETIMED_GIF_SETTINGS))
+    gif_data = RETIMED_GIF_DATA.get(key)
+    if gif_data is None:
+        durations = find_frame_durations(get_frame_timeline(gif_path, should_stop), settings)
+        buffer = io.BytesIO()
+        with instrumentation.stage("write_gif"):
+            write_retimed_gif_to(gif_path, buffer, durations, lambda: check_cancelled(should_stop))
+        gif_data = buffer.getvalue()
+        RETIMED_GIF_DATA.put(key, gif_data)
+    return gif_data
 
-                    if settings.cutoff_distance > 0:
-                        if silence_after_moment == -1:
-                            if len(timings) > 0 and offsetted_moment - timings[len(timings) - 1] >= settings.cutoff_distance / settings.speed:
-                                should_append = False
-                                silence_after_moment = offsetted_moment
-                        elif offsetted_moment > silence_after_moment:
-                            should_append = False
 
-                    if should_append:
-                        timings.append(offsetted_moment)
+def insert_blip(
+        insert_in: BlipMixer,
+        voices: list[AudioSegment],
+        this_blip: int, next_blip: int,
+        settings: SoundifierSettings,
+        voice_index: int,
+        pitch: Optional[float],
+        pitches: Optional[PitchBank] = None
+) -> None:
+    voice: AudioSegment = voices[voice_index]
+
+    if pitch is not None:
+        if pitches is not None:
+            voice = pitches.get(voice_index, pitch)
         else:
-            if consecutive_identical_frames >= 2:
-                metta_letters = 0
-            else:
-                metta_letters += 1
-            consecutive_identical_frames += 1
+            voice = pitch_voice(voice, pitch)
 
-        skip_rendering_frame = settings.mettatonize and settings.interval != 1 and metta_letters % settings.interval != 0 and frame_number < last_changing_frame and not about_to_pause
+    if settings.do_overlap_prevention:
+        duration = next_blip - this_blip + settings.olp_hard_cutoff_leniency
+        samples = insert_in.cut_and_fade(voice, duration, settings.olp_fade_duration)
+        if samples is not None:
+            insert_in.add_samples(samples, this_blip)
+            return
 
-        if not skip_rendering_frame:
-            frames.append(frame.copy())
-            durations.append(accumulated_frame_duration)
-            accumulated_frame_duration = 0
+        voice = AudioSegment.silent(duration=duration).overlay(voice)
+        if settings.olp_fade_duration > 0:
+            voice = voice.fade_out(duration=settings.olp_fade_duration)
 
-        prev_frame = frame.copy()
+    insert_in.add(voice, this_blip)
 
-    if settings.output_gif_path is not None:
-        frames[0].save(
-            settings.output_gif_path,
-            save_all=True,
-            append_images=frames[1:],
-            duration=durations,
-            loop=gif.info['loop'],
-            disposal=2
-        )
-        print(f"Successfully saved speed-altered gif as {settings.output_gif_path}")
 
-    return timings
+@functools.lru_cache(maxsize=16)
+def get_skipped_letters(full_text: str, skip_characters: str, skip_non_alphanumeric: bool) -> numpy.ndarray:
+    # Whether each letter of the transcript is skipped. Spaces don't get a blip, so they don't count as letters, and
+    # the first letter is at index 1 because the first blip is never skipped this way.
+    letters = [letter for letter in full_text if not letter.isspace()]
+    skipped = numpy.zeros(len(letters) + 1, dtype=bool)
+    skipped[1:] = numpy.fromiter(
+        ((skip_non_alphanumeric and not (letter.isalpha() or letter.isdigit())) or letter in skip_characters for letter in letters),
+        dtype=bool,
+        count=len(letters)
+    )
+    # The same array is handed out for as long as the transcript stays the same
+    skipped.flags.writeable = False
+    return skipped
 
 
-def insert_blip(
-        insert_in: AudioSegment,
-        voices: list[AudioSegment],
-        this_blip: int, next_blip: int,
-        settings: SoundifierSettings
-) -> AudioSegment:
-    voice: AudioSegment = random.choice(voices)
+def find_skipped_blips(settings: SoundifierSettings, blip_count: int) -> numpy.ndarray:
+    skipped_blips = numpy.zeros(blip_count, dtype=bool)
+    if settings.skip_punctuation:
+        skipped_letters = get_skipped_letters(settings.full_text, settings.skip_characters, settings.skip_non_alphanumeric)
+        overlap = min(blip_count, len(skipped_letters))
+        skipped_blips[:overlap] = skipped_letters[:overlap]
+    return skipped_blips
 
-    if (settings.min_pitch != 1 or settings.max_pitch != 1) and random.uniform(0, 1) <= settings.random_pitch_chance:
-        new_sample_rate = int(voice.frame_rate * random.uniform(settings.min_pitch, settings.max_pitch))
-        voice = voice._spawn(voice.raw_data, overrides={"frame_rate": new_sample_rate}).set_frame_rate(voice.frame_rate)
 
-    if settings.do_overlap_prevention:
-        voice = AudioSegment.silent(duration=next_blip - this_blip + settings.olp_hard_cutoff_leniency).overlay(voice)
-        if settings.olp_fade_duration > 0:
-            voice = voice.fade_out(duration=settings.olp_fade_duration)
+def plan_blips(blip_timings: list[int], settings: SoundifierSettings, voice_count: int,
+               rng: random.Random) -> list[PlannedBlip]:
+    skipped_blips = find_skipped_blips(settings, len(blip_timings))
+    pitched = settings.min_pitch != 1 or settings.max_pitch != 1
+
+    plan = []
+    for index in range(len(blip_timings)):
+        if settings.skip_first_blip and index == 1:
+            continue
+
+        if skipped_blips[index]:
+            continue
+
+        voice_index: int = rng.choice(range(voice_count))
+        pitch: Optional[float] = None
+        if pitched and rng.uniform(0, 1) <= settings.random_pitch_chance:
+            pitch = rng.uniform(settings.min_pitch, settings.max_pitch)
 
-    return insert_in.overlay(voice, position=this_blip)
+        plan.append(PlannedBlip(index, voice_index, pitch))
+    return plan
 
 
-def make_blip_track(gif: str, settings: SoundifierSettings, *sound_paths: str) -> AudioSegment:
+def expand_voice_paths(sound_paths: tuple[str, ...]) -> tuple[str, ...]:
     if len(sound_paths) == 1 and "#" in sound_paths[0] and not os.path.isfile(sound_paths[0]):
         index: int
         if os.path.isfile(sound_paths[0].replace("#", "0")):
@@ -155,91 +289,176 @@ def make_blip_track(gif: str, settings: SoundifierSettings, *sound_paths: str) -
             index += 1
             numerated_paths.append(checking_path)
 
-        return make_blip_track(gif, settings, *numerated_paths)
+        return tuple(numerated_paths)
 
-    audios: list[AudioSegment] = []
-    for sound_path in sound_paths:
-        audios.append(AudioSegment.from_file(sound_path))
+    return sound_paths
 
-    max_sound_length = 0
-    for audio in audios:
-        if audio.duration_seconds > max_sound_length:
-            max_sound_length = audio.duration_seconds
 
-    blip_timings = get_blip_timings_from_gif(gif, settings)
-    final_blip_timing = blip_timings[len(blip_timings) - 1]
+def prepare_blip_mix(gif: str, settings: SoundifierSettings, *sound_paths: str,
+                     should_stop: Optional[Callable[[], bool]] = None) -> MixSource:
+    with instrumentation.stage("load_voices"):
+        voice_paths = expand_voice_paths(sound_paths)
+        voice_format = voice_cache.get_voice_format(
+            [voice_cache.VOICES.get(sound_path) for sound_path in voice_paths],
+            settings.output_frame_rate, settings.output_channels, settings.output_sample_width
+        )
+        samples: list[voice_cache.VoiceSample] = [voice_cache.VOICES.get(sound_path, voice_format) for sound_path in voice_paths]
+        audios: list[AudioSegment] = [sample.to_audio_segment() for sample in samples]
 
-    skip_indices = []
-    skip_characters = ""
-    if settings.skip_punctuation:
-        for char in settings.skip_characters:
-            if not char.isspace():
-                skip_characters += char
+    blip_timings = get_blip_timings_from_gif(gif, settings, should_stop)
 
-        character_index = 0
-        for letter in settings.full_text:
-            if letter.isspace(): continue
+    # Every render gets its own generator, so nothing else drawing random numbers can change how it comes out
+    rng = random.Random(settings.seed)
+    if settings.seed is None:
+        with instrumentation.stage("plan_blips"):
+            plan = plan_blips(blip_timings, settings, len(samples), rng)
+        return MixSource(None, samples, audios, blip_timings, plan)
 
-            character_index += 1
-            print(f"Character at index {character_index} is {letter}")
+    plan_key = (get_blip_timings_key(gif, settings), get_settings_key(settings, PLAN_SETTINGS), len(samples))
+    plan = BLIP_PLANS.get(plan_key)
+    if plan is None:
+        with instrumentation.stage("plan_blips"):
+            plan = plan_blips(blip_timings, settings, len(samples), rng)
+        BLIP_PLANS.put(plan_key, plan)
 
-            if settings.skip_non_alphanumeric and not (letter.isalpha() or letter.isdigit()):
-                skip_indices.append(character_index)
-                continue
+    key = (plan_key, tuple((sample.path, sample.mtime) for sample in samples), get_settings_key(settings, MIX_SETTINGS))
+    return MixSource(key, samples, audios, blip_timings, plan)
 
-            if letter in settings.skip_characters:
-                skip_indices.append(character_index)
 
-    total_duration = (final_blip_timing + (max_sound_length * 1000) + 150)
-    output = AudioSegment.silent(duration=total_duration)
-    for index in range(len(blip_timings)):
-        blip = blip_timings[index]
+def mix_blips(source: MixSource, settings: SoundifierSettings, should_stop: Optional[Callable[[], bool]] = None,
+              stream_to: Optional[str] = None) -> BlipMixer:
+    if stream_to is None and source.key is not None:
+        cached: Optional[BlipMixer] = MIXES.get(source.key)
+        if cached is not None:
+            return cached
 
-        next_blip: int
-        if index == len(blip_timings) - 1:
-            next_blip = round(total_duration)
-        else:
-            next_blip = blip_timings[index + 1]
+    pitches: Optional[PitchBank] = None
+    if settings.pitch_steps > 0 and (settings.min_pitch != 1 or settings.max_pitch != 1):
+        with instrumentation.stage("resample_pitches"):
+            pitches = PitchBank(source.samples, source.audios, settings.min_pitch, settings.max_pitch, settings.pitch_steps)
 
-        if settings.skip_first_blip and index == 1:
-            continue
-
-        if settings.skip_punctuation and index in skip_indices:
-            continue
+    max_sound_length = 0
+    for audio in source.audios:
+        if audio.duration_seconds > max_sound_length:
+            max_sound_length = audio.duration_seconds
 
-        output = insert_blip(output, audios, blip, next_blip, settings)
+    blip_timings = source.blip_timings
+    final_blip_timing = blip_timings[len(blip_timings) - 1]
 
+    total_duration = (final_blip_timing + (max_sound_length * 1000) + 150)
+    output: BlipMixer
+    if stream_to is not None:
+        output = StreamingBlipMixer(total_duration, source.audios, stream_to)
+    else:
+        output = BlipMixer(total_duration, source.audios)
+    # Streamed mixes write as they go, so their time includes writing the wav
+    with instrumentation.stage("mix", blips=len(source.plan), streaming=stream_to is not None):
+        try:
+            for planned in source.plan:
+                check_cancelled(should_stop)
+                blip = blip_timings[planned.timing_index]
+
+                next_blip: int
+                if planned.timing_index == len(blip_timings) - 1:
+                    next_blip = round(total_duration)
+                else:
+                    next_blip = blip_timings[planned.timing_index + 1]
+
+                insert_blip(output, source.audios, blip, next_blip, settings, planned.voice_index, planned.pitch, pitches)
+
+            if isinstance(output, StreamingBlipMixer):
+                output.finish()
+        finally:
+            # A cancelled or failed stream leaves nothing behind, and a finished one has nothing left to clean up
+            if isinstance(output, StreamingBlipMixer):
+                output.discard()
+    instrumentation.count("blips_inserted", len(source.plan))
+
+    if not isinstance(output, StreamingBlipMixer) and source.key is not None:
+        MIXES.put(source.key, output)
     return output
 
 
-def save_blip_track(settings: SoundifierSettings, audio: AudioSegment) -> None:
-    audio.export(settings.output_audio_path, format="wav")
-    print(f"Successfully saved audio as {settings.output_audio_path}")
+def make_blip_mix(gif: str, settings: SoundifierSettings, *sound_paths: str,
+                  should_stop: Optional[Callable[[], bool]] = None, stream_to: Optional[str] = None) -> BlipMixer:
+    source = prepare_blip_mix(gif, settings, *sound_paths, should_stop=should_stop)
+    return mix_blips(source, settings, should_stop, stream_to)
+
+
+def make_blip_track(gif: str, settings: SoundifierSettings, *sound_paths: str,
+                    should_stop: Optional[Callable[[], bool]] = None,
+                    recorder: Optional[instrumentation.Recorder] = None) -> AudioSegment:
+    with instrumentation.recording(recorder), instrumentation.stage("make_blip_track", gif=gif):
+        return make_blip_mix(gif, settings, *sound_paths, should_stop=should_stop).to_audio_segment()
 
 
-def make_and_save_blip_track(gif: str, settings: SoundifierSettings, *sound_paths: str) -> None:
-    save_blip_track(settings, make_blip_track(gif, settings, *sound_paths))
+def log_saved_audio(settings: SoundifierSettings, from_cache: bool = False) -> None:
+    if not from_cache:
+        written = get_written_file_state(settings.output_audio_path)
+        instrumentation.count("bytes_written", written[1] if written is not None else 0)
+    instrumentation.log_event("audio_saved", f"Successfully saved audio as {settings.output_audio_path}"
+                              + (" (from the render cache)" if from_cache else ""),
+                              path=settings.output_audio_path, from_cache=from_cache)
+
+
+def save_blip_track(settings: SoundifierSettings, audio: AudioSegment | BlipMixer) -> None:
+    with instrumentation.stage("write_audio", path=settings.output_audio_path):
+        if isinstance(audio, BlipMixer):
+            audio.export_wav(settings.output_audio_path)
+        else:
+            audio.export(settings.output_audio_path, format="wav")
+    log_saved_audio(settings)
+
+
+def render_preview(gif: str, settings: SoundifierSettings, *sound_paths: str,
+                   should_stop: Optional[Callable[[], bool]] = None, with_gif: bool = False) -> PreviewRender:
+    # Renders everything in memory, so previews never write into the app's own folder
+    settings = settings.snapshot(output_gif_path=None)
+    audio = mix_blips(prepare_blip_mix(gif, settings, *sound_paths, should_stop=should_stop), settings, should_stop).to_audio_segment()
+    gif_data = get_speed_altered_gif_data(gif, settings, should_stop) if with_gif else None
+    return PreviewRender(audio, gif_data)
+
+
+def make_and_save_blip_track(gif: str, settings: SoundifierSettings, *sound_paths: str,
+                             should_stop: Optional[Callable[[], bool]] = None,
+                             recorder: Optional[instrumentation.Recorder] = None) -> bool:
+    # Returns whether the track was served from the render cache instead of being rendered
+    with instrumentation.recording(recorder), instrumentation.stage("make_and_save_blip_track", gif=gif):
+        return render_and_save_blip_track(gif, settings, *sound_paths, should_stop=should_stop)
+
+
+def render_and_save_blip_track(gif: str, settings: SoundifierSettings, *sound_paths: str,
+                               should_stop: Optional[Callable[[], bool]] = None) -> bool:
+    with instrumentation.stage("look_up_render_cache"):
+        render_key = render_cache.get_render_key(gif, expand_voice_paths(sound_paths), settings)
+        restored = render_key is not None and render_cache.restore_render(render_key, settings)
+    if restored:
+        instrumentation.count("render_cache_hits")
+        log_saved_audio(settings, from_cache=True)
+        return True
+
+    source = prepare_blip_mix(gif, settings, *sound_paths, should_stop=should_stop)
+
+    saved_key = (source.key, settings.output_audio_path)
+    if source.key is not None:
+        written = SAVED_TRACKS.get(saved_key)
+        if written is not None and written == get_written_file_state(settings.output_audio_path):
+            if render_key is not None:
+                render_cache.store_render(render_key, settings)
+            return False
+
+    if settings.stream_audio:
+        mix_blips(source, settings, should_stop, stream_to=settings.output_audio_path)
+        log_saved_audio(settings)
+    else:
+        save_blip_track(settings, mix_blips(source, settings, should_stop))
+    if source.key is not None:
+        SAVED_TRACKS.put(saved_key, get_written_file_state(settings.output_audio_path))
+    if render_key is not None:
+        render_cache.store_render(render_key, settings)
+    return False
 
 
 if __name__ == '__main__':
-    args: list[str] = sys.argv[1:]
-    if len(args) == 0:
-        args.append("./test input/typer.gif")
-        args.append("./test voices/typer.wav")
-
-    voice_paths: list[str] = []
-    path_of_gif: str = ""
-    for path in args:
-        if path[len(path) - 4:] == ".gif":
-            path_of_gif = path
-        if path[len(path) - 4:] == ".wav":
-            voice_paths.append(path)
-
-    if len(voice_paths) == 0:
-        raise Exception("No voices provided!")
-    if path_of_gif == "":
-        raise Exception("No gif provided!")
-
-    settings = SoundifierSettings("./test output/output.wav")
-    settings.output_audio_path = "./test output/output.gif"
-    make_and_save_blip_track(path_of_gif, settings, *voice_paths)
+    import cli
+    sys.exit(cli.main())
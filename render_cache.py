@@ -0,0 +1,121 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Optional
+
+from disk_cache import evict_files
+from girlhelp import cache_path
+from instrumentation import log_event
+from settings import SoundifierSettings
+from stage_cache import get_file_identity
+
+# Version 2 renders were hardlinked to the outputs, so anything that edited an output in place edited them too
+CACHE_VERSION = 3
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Where the outputs go, and whether the wav was streamed while mixing, don't change what's in them
+IGNORED_SETTINGS = ("output_audio_path", "output_gif_path", "stream_audio")
+
+
+def get_cache_directory() -> str:
+    return cache_path("renders")
+
+
+@functools.lru_cache(maxsize=256)
+def get_file_digest(identity: tuple) -> str:
+    # Keyed on the path, mtime and size, so unchanged files are only ever read once
+    digest = hashlib.sha256()
+    with open(identity[0], "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_inputs_digest(gif_path: str, voice_paths: tuple[str, ...], settings: SoundifierSettings) -> str:
+    values = {name: value for name, value in vars(settings).items() if name not in IGNORED_SETTINGS}
+    values["saving_gif"] = settings.output_gif_path is not None
+    key = [
+        CACHE_VERSION,
+        get_file_digest(get_file_identity(gif_path)),
+        [get_file_digest(get_file_identity(voice_path)) for voice_path in voice_paths],
+        values
+    ]
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get_render_key(gif_path: str, voice_paths: tuple[str, ...], settings: SoundifierSettings) -> Optional[str]:
+    # Unseeded renders come out different every time, so there's nothing to reuse
+    if settings.seed is None:
+        return None
+    return get_inputs_digest(gif_path, voice_paths, settings)
+
+
+def get_entry_paths(key: str, settings: SoundifierSettings) -> list[tuple[str, str]]:
+    # Pairs of (cached file, output file) for everything a render saves
+    directory = get_cache_directory()
+    paths = [(f"{directory}/{key}.wav", settings.output_audio_path)]
+    if settings.output_gif_path is not None:
+        paths.append((f"{directory}/{key}.gif", settings.output_gif_path))
+    return paths
+
+
+def get_marker_path(key: str) -> str:
+    return f"{get_cache_directory()}/{key}.used"
+
+
+def mark_used(key: str) -> None:
+    # An empty marker next to the cached files is touched whenever they're used, so eviction drops the least recently
+    # used renders first
+    with open(get_marker_path(key), "a"):
+        pass
+    os.utime(get_marker_path(key))
+
+
+def copy_file(source: str, destination: str) -> None:
+    # Always a real copy, never a link, so the cache and the user's outputs can't change each other. It only shows up
+    # under its name once it's complete.
+    temporary_path = destination + ".tmp"
+    try:
+        shutil.copyfile(source, temporary_path)
+        os.replace(temporary_path, destination)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def restore_render(key: str, settings: SoundifierSettings) -> bool:
+    paths = get_entry_paths(key, settings)
+    if not all(os.path.isfile(cached) for cached, _ in paths):
+        return False
+
+    try:
+        for cached, output in paths:
+            copy_file(cached, output)
+        mark_used(key)
+    except OSError:
+        return False
+    return True
+
+
+def store_render(key: str, settings: SoundifierSettings) -> None:
+    try:
+        os.makedirs(get_cache_directory(), exist_ok=True)
+        for cached, output in get_entry_paths(key, settings):
+            # Renders are keyed on everything that goes into them, so one that's already cached is the same
+            if not os.path.isfile(cached):
+                copy_file(output, cached)
+        mark_used(key)
+    except OSError as e:
+        log_event("render_cache_failed", f"Couldn't cache the render of {settings.output_audio_path}.\n\tCaused by: {e}",
+                  logging.WARNING, path=settings.output_audio_path, error=str(e))
+        return
+
+    evict_renders()
+
+
+def evict_renders(max_bytes: int = CACHE_MAX_BYTES) -> None:
+    # A render's wav, gif and marker are kept or dropped together
+    evict_files(get_cache_directory(), max_bytes, get_group=lambda name: name.split(".")[0])
@@ -0,0 +1,169 @@
+import heapq
+import itertools
+import threading
+from typing import Any, Callable, Optional
+
+# Lower runs first. Previews are what someone is waiting on right now, exports can take their time.
+PREVIEW = 0
+EXPORT = 1
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STARTED = "started"
+PROGRESSED = "progressed"
+FINISHED = "finished"
+
+DEFAULT_WORKERS = 2
+
+Listener = Callable[[str, "RenderTask"], None]
+
+
+class RenderTask:
+    # One piece of work for the scheduler. The work is handed its own task, so it can pass is_cancelled on as
+    # should_stop and report how far along it is. Details are for whoever is listening, like which gif it's for.
+    def __init__(self, name: str, priority: int, work: Callable[["RenderTask"], Any], **details: Any):
+        self.name = name
+        self.priority = priority
+        self.work = work
+        self.details = details
+        self.state = QUEUED
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+        self.progress: tuple[int, int] = (0, 0)
+        self.scheduler: Optional["RenderScheduler"] = None
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+        if self.scheduler is not None:
+            self.scheduler.dequeue(self)
+
+    def report_progress(self, done: int, total: int) -> None:
+        self.progress = (done, total)
+        if self.scheduler is not None:
+            self.scheduler.notify(PROGRESSED, self)
+
+    def is_finished(self) -> bool:
+        return self.done_event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done_event.wait(timeout)
+
+
+class RenderScheduler:
+    # A small pool of render threads fed from one queue, highest priority first. Background work never gets the
+    # reserved threads, so a preview can always start right away, next to an export that's still going.
+    def __init__(self, workers: int = DEFAULT_WORKERS, reserved: int = 1):
+        self.workers = max(1, workers)
+        self.background_limit = max(1, self.workers - reserved)
+        self.queue: list[tuple[int, int, RenderTask]] = []
+        self.sequence = itertools.count()
+        self.running: list[RenderTask] = []
+        self.threads: list[threading.Thread] = []
+        self.listeners: list[Listener] = []
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def add_listener(self, listener: Listener) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        self.listeners.remove(listener)
+
+    def notify(self, event: str, task: RenderTask) -> None:
+        for listener in self.listeners:
+            listener(event, task)
+
+    def submit(self, task: RenderTask) -> RenderTask:
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The render scheduler has been shut down")
+            task.scheduler = self
+            heapq.heappush(self.queue, (task.priority, next(self.sequence), task))
+            # Threads are only started once there's something for them to do
+            if len(self.threads) < self.workers and len(self.threads) < len(self.queue) + len(self.running):
+                thread = threading.Thread(target=self.work, name=f"render-{len(self.threads)}", daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.condition.notify_all()
+        return task
+
+    def dequeue(self, task: RenderTask) -> None:
+        # Tasks that haven't started are dropped right away, running ones stop when they next check is_cancelled
+        with self.condition:
+            if task.state != QUEUED:
+                return
+            self.queue = [entry for entry in self.queue if entry[2] is not task]
+            heapq.heapify(self.queue)
+            task.state = CANCELLED
+        task.done_event.set()
+        self.notify(FINISHED, task)
+
+    def get_pending(self, priority: Optional[int] = None) -> list[RenderTask]:
+        # Everything queued or running, optionally only of one priority
+        with self.condition:
+            tasks = self.running + [task for _, _, task in sorted(self.queue)]
+        return [task for task in tasks if priority is None or task.priority == priority]
+
+    def cancel_all(self, priority: Optional[int] = None) -> None:
+        for task in self.get_pending(priority):
+            task.cancel()
+
+    def can_start(self, task: RenderTask) -> bool:
+        if task.priority <= PREVIEW:
+            return True
+        return sum(1 for running in self.running if running.priority > PREVIEW) < self.background_limit
+
+    def take_next(self) -> Optional[RenderTask]:
+        with self.condition:
+            while True:
+                if self.closed:
+                    return None
+                # Previews sort first, so if the head of the queue can't start, nothing behind it can either
+                if len(self.queue) > 0 and self.can_start(self.queue[0][2]):
+                    task = heapq.heappop(self.queue)[2]
+                    task.state = RUNNING
+                    self.running.append(task)
+                    return task
+                self.condition.wait()
+
+    def work(self) -> None:
+        while True:
+            task = self.take_next()
+            if task is None:
+                return
+
+            self.notify(STARTED, task)
+            try:
+                task.result = task.work(task)
+                task.state = CANCELLED if task.is_cancelled() else SUCCEEDED
+            except Exception as e:
+                # Work that notices it was cancelled usually gets out by raising
+                if task.is_cancelled():
+                    task.state = CANCELLED
+                else:
+                    task.error = e
+                    task.state = FAILED
+
+            with self.condition:
+                self.running.remove(task)
+                self.condition.notify_all()
+            task.done_event.set()
+            self.notify(FINISHED, task)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.cancel_all()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
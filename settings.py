@@ -1,9 +1,12 @@
+import copy
 from typing import Optional
 
 class SoundifierSettings:
     def __init__(self, output_audio_path: str):
         self.output_audio_path: str = output_audio_path
         self.output_gif_path: Optional[str] = None
+        # Writes the wav in chunks while mixing instead of building the whole track first
+        self.stream_audio: bool = False
 
         self.speed: float = 1
 
@@ -17,6 +20,16 @@ class SoundifierSettings:
         self.random_pitch_chance: float = 1
         self.min_pitch: float = 1
         self.max_pitch: float = 1
+        # 0 keeps pitches continuous, otherwise they snap to this many steps that are only resampled once
+        self.pitch_steps: int = 0
+        # Renders with the same seed (and everything else the same) come out identical. None picks a new one each time.
+        self.seed: Optional[int] = None
+        # Every voice is converted to this format once when it's loaded, and the track comes out in it. None takes the
+        # widest of the voices. A lower frame rate like 22050 makes drafts quicker, 48000 is for masters.
+        self.output_frame_rate: Optional[int] = None
+        self.output_channels: Optional[int] = None
+        # In bytes, 2 for 16-bit or 4 for 32-bit
+        self.output_sample_width: Optional[int] = None
 
         self.easy_align: bool = True
         self.making_for_preview: bool = True
@@ -30,3 +43,11 @@ class SoundifierSettings:
         self.skip_non_alphanumeric = True
         self.skip_characters: str = ""
         self.full_text: str = ""
+
+    def snapshot(self, **overrides) -> "SoundifierSettings":
+        snapshot = copy.deepcopy(self)
+        for name, value in overrides.items():
+            if not hasattr(snapshot, name):
+                raise AttributeError(f"SoundifierSettings has no setting named {name}")
+            setattr(snapshot, name, value)
+        return snapshot
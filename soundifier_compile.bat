@@ -1,3 +1,4 @@
+py character_index.py assets/builtin_voices
 py -m PyInstaller --onefile --windowed ^
 	--icon=soundifier.ico ^
 	--additional-hooks-dir=. ^
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from settings import SoundifierSettings
+
+
+def get_settings_key(settings: SoundifierSettings, names: tuple[str, ...]) -> tuple:
+    return tuple(getattr(settings, name) for name in names)
+
+
+def get_file_identity(path: str) -> tuple:
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def get_written_file_state(path: str) -> Optional[tuple]:
+    # What an output file looked like right after it was written, to tell whether anything has touched it since
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class StageCache:
+    # Remembers the last few results of one render stage. Keys are made of everything the stage reads, so a result
+    # is only reused when nothing it depends on has changed.
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class SizedCache:
+    # Like StageCache, but bounded by the total size of what it holds instead of how many things. The newest value is
+    # always kept, even if it's bigger than the whole budget on its own.
+    def __init__(self, max_bytes: int, get_size: Callable[[Any], int]):
+        self.max_bytes = max_bytes
+        self.get_size = get_size
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= self.get_size(previous)
+
+            self.entries[key] = value
+            self.total_bytes += self.get_size(value)
+
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= self.get_size(evicted)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
@@ -0,0 +1,114 @@
+import builtins
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from girlhelp import cache_path
+
+# Frozen builds can't be started with -X importtime, so this does the same job from inside: every module imported
+# while it's running is timed, along with named steps like the window showing up.
+
+FLAG = "--startup-timing"
+
+
+class ImportRecord:
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.cumulative = 0.0
+        self.children = 0.0
+
+
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.imports: list[ImportRecord] = []
+        self.marks: list[tuple[str, float]] = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.original_import = builtins.__import__
+
+    def install(self) -> None:
+        builtins.__import__ = self.timed_import
+
+    def uninstall(self) -> None:
+        if builtins.__import__ == self.timed_import:
+            builtins.__import__ = self.original_import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level > 0 or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        stack = self.local.__dict__.setdefault("stack", [])
+        record = ImportRecord(name, len(stack))
+        with self.lock:
+            self.imports.append(record)
+        stack.append(record)
+        started = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            record.cumulative = time.perf_counter() - started
+            stack.pop()
+            if len(stack) > 0:
+                stack[-1].children += record.cumulative
+
+    def mark(self, step: str) -> None:
+        with self.lock:
+            self.marks.append((step, time.perf_counter() - self.start))
+
+    def get_report(self) -> str:
+        lines = ["import time: self [us] | cumulative | imported package"]
+        with self.lock:
+            for record in self.imports:
+                own = round((record.cumulative - record.children) * 1e6)
+                lines.append(f"import time: {own:>9} | {round(record.cumulative * 1e6):>10} | {'  ' * record.depth}{record.name}")
+            lines.append("")
+            for step, elapsed in self.marks:
+                lines.append(f"startup: {elapsed * 1000:>9.1f} ms | {step}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self) -> None:
+        # Windowed builds have no console to print to, so the report goes next to the other caches instead
+        report = self.get_report()
+        if sys.stderr is not None:
+            sys.stderr.write(report)
+            sys.stderr.flush()
+            return
+
+        report_path = cache_path("startup_timing.txt")
+        try:
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+            with open(report_path, "w", encoding="utf-8") as file:
+                file.write(report)
+        except OSError:
+            pass
+
+
+TIMER: Optional[StartupTimer] = None
+
+
+def start_if_requested(argv: list[str]) -> None:
+    global TIMER
+    if FLAG not in argv:
+        return
+    argv.remove(FLAG)
+    TIMER = StartupTimer()
+    TIMER.install()
+
+
+def mark(step: str) -> None:
+    if TIMER is not None:
+        TIMER.mark(step)
+
+
+def finish() -> None:
+    # Called once everything startup kicks off has loaded
+    global TIMER
+    if TIMER is None:
+        return
+    TIMER.uninstall()
+    TIMER.write_report()
+    TIMER = None
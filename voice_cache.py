@@ -0,0 +1,132 @@
+import os
+import threading
+from typing import Iterable, NamedTuple, Optional
+
+import numpy
+from pydub import AudioSegment
+
+import instrumentation
+from mixer import SAMPLE_TYPES
+from stage_cache import SizedCache
+
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# The mixer's track never goes below pydub's default 11025 Hz 16-bit silence, so neither can voices meant to be mixed
+# into it without converting
+MIN_FRAME_RATE = 11025
+CHANNEL_COUNTS = (1, 2)
+SAMPLE_WIDTHS = (2, 4)
+
+
+class VoiceFormat(NamedTuple):
+    channels: int
+    frame_rate: int
+    sample_width: int
+
+
+class VoiceSample:
+    def __init__(self, path: str, mtime: int, samples: numpy.ndarray, frame_rate: int, channels: int, sample_width: int,
+                 voice_format: Optional[VoiceFormat] = None):
+        self.path = path
+        self.mtime = mtime
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        # What it was converted to, or None if it's just as it was decoded
+        self.voice_format = voice_format
+
+    def get_format(self) -> VoiceFormat:
+        return VoiceFormat(self.channels, self.frame_rate, self.sample_width)
+
+    def size_in_bytes(self) -> int:
+        return self.samples.nbytes
+
+    def to_audio_segment(self) -> AudioSegment:
+        return AudioSegment(
+            data=self.samples.tobytes(),
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
+
+
+class VoiceCache:
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.samples = SizedCache(max_bytes, VoiceSample.size_in_bytes)
+        self.decode_count = 0
+        self.lock = threading.Lock()
+
+    def get(self, path: str, voice_format: Optional[VoiceFormat] = None) -> VoiceSample:
+        # With a format, the voice comes converted to it. That's done once and kept alongside the decoded voice, so
+        # the mixer gets voices that are already in the track's format and never has to convert them per blip.
+        key = (os.path.abspath(path), voice_format)
+        mtime = os.stat(path).st_mtime_ns
+
+        entry = self.samples.get(key)
+        if entry is not None and entry.mtime == mtime:
+            return entry
+
+        if voice_format is not None:
+            decoded = self.get(path)
+            if decoded.get_format() == voice_format:
+                return decoded
+            entry = normalize_voice(decoded, voice_format)
+            instrumentation.count("voices_normalized")
+        else:
+            entry = decode_voice(path, mtime)
+            with self.lock:
+                self.decode_count += 1
+            instrumentation.count("voices_decoded")
+        self.put(entry)
+        return entry
+
+    def put(self, entry: VoiceSample) -> None:
+        self.samples.put((entry.path, entry.voice_format), entry)
+
+    def clear(self) -> None:
+        self.samples.clear()
+
+
+def decode_voice(path: str, mtime: int) -> VoiceSample:
+    audio = AudioSegment.from_file(path)
+    samples = numpy.frombuffer(audio.raw_data, dtype=SAMPLE_TYPES[audio.sample_width])
+    return VoiceSample(os.path.abspath(path), mtime, samples, audio.frame_rate, audio.channels, audio.sample_width)
+
+
+def normalize_voice(sample: VoiceSample, voice_format: VoiceFormat) -> VoiceSample:
+    # Converted in the same order the mixer would convert it
+    audio = sample.to_audio_segment().set_channels(voice_format.channels).set_frame_rate(voice_format.frame_rate) \
+        .set_sample_width(voice_format.sample_width)
+    samples = numpy.frombuffer(audio.raw_data, dtype=SAMPLE_TYPES[audio.sample_width])
+    return VoiceSample(sample.path, sample.mtime, samples, audio.frame_rate, audio.channels, audio.sample_width, voice_format)
+
+
+def get_voice_format(samples: list[VoiceSample], frame_rate: Optional[int] = None, channels: Optional[int] = None,
+                     sample_width: Optional[int] = None) -> VoiceFormat:
+    # Anything not asked for is the widest of the voices, which is what the mix would have come out as anyway
+    if frame_rate is not None and frame_rate < MIN_FRAME_RATE:
+        raise ValueError(f"The frame rate has to be at least {MIN_FRAME_RATE} Hz, not {frame_rate}")
+    if channels is not None and channels not in CHANNEL_COUNTS:
+        raise ValueError(f"Voices can only be mixed as mono or stereo, not with {channels} channels")
+    if sample_width is not None and sample_width not in SAMPLE_WIDTHS:
+        raise ValueError(f"The sample width has to be 2 (16-bit) or 4 (32-bit) bytes, not {sample_width}")
+
+    return VoiceFormat(
+        channels if channels is not None else max([1] + [sample.channels for sample in samples]),
+        frame_rate if frame_rate is not None else max([MIN_FRAME_RATE] + [sample.frame_rate for sample in samples]),
+        sample_width if sample_width is not None else max([2] + [sample.sample_width for sample in samples])
+    )
+
+
+VOICES = VoiceCache()
+
+
+def export_voices(paths: Iterable[str]) -> list[VoiceSample]:
+    return [VOICES.get(path) for path in paths if os.path.isfile(path)]
+
+
+def preload_voices(entries: Optional[list[VoiceSample]]) -> None:
+    # Used as a process pool initializer, so worker processes start with voices the parent already decoded
+    for entry in entries or []:
+        VOICES.put(entry)